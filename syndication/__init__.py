@@ -0,0 +1,10 @@
+import logging
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+
+# Stop "No handlers could be found" messages if the project doesn't
+# configure logging.
+logging.getLogger('syndication').addHandler(NullHandler())
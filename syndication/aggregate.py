@@ -0,0 +1,96 @@
+"""
+Aggregated ("planet") feeds made up of the newest items of other feeds.
+"""
+import calendar
+import heapq
+
+from syndication import views
+
+
+class AggregatedItem(object):
+    """
+    An item of one of the sources of an AggregateFeed.
+    """
+    def __init__(self, source, item, templates):
+        self.source = source
+        self.item = item
+        self.templates = templates
+
+    def __unicode__(self):
+        return unicode(self.item)
+
+
+def newest_first(pubdate):
+    """
+    Returns a key that sorts timezone-aware pubdates newest first, with
+    items without a pubdate last.
+    """
+    if pubdate is None:
+        return (True, 0)
+    return (False, -(calendar.timegm(pubdate.utctimetuple()) + pubdate.microsecond / 1e6))
+
+
+def merge_newest_first(streams):
+    """
+    Merges several iterables of (pubdate, value) tuples, each already
+    ordered newest first, into one iterable ordered newest first. Only one
+    value from each iterable is read ahead.
+    """
+    heap = []
+    for index, stream in enumerate(streams):
+        iterator = iter(stream)
+        try:
+            pubdate, value = iterator.next()
+        except StopIteration:
+            continue
+        heap.append((newest_first(pubdate), index, pubdate, value, iterator))
+    heapq.heapify(heap)
+    while heap:
+        key, index, pubdate, value, iterator = heap[0]
+        yield pubdate, value
+        try:
+            pubdate, value = iterator.next()
+        except StopIteration:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (newest_first(pubdate), index, pubdate, value, iterator))
+
+
+class AggregateFeed(views.Feed):
+    """
+    A feed of the newest items of the feeds in sources, which should be
+    syndication.views.Feed instances whose items are ordered newest first.
+
+    Items are taken from the sources lazily, merging them by pubdate and
+    skipping items with a guid (or link) that has already been seen, so only
+    about as many items as end up in the feed are fetched and resolved. Each
+    item is resolved by the source it came from. Set max_items to the number
+    of items wanted.
+    """
+    sources = ()
+
+    def source_items(self, source, limit):
+        templates = (views.find_template(source.title_template),
+                     views.find_template(source.description_template))
+        for item in source.get_items(None, limit):
+            yield source.get_item_pubdate(item), AggregatedItem(source, item, templates)
+
+    def get_items(self, obj, limit=None, state=None):
+        streams = [self.source_items(source, limit) for source in self.sources]
+        seen = {}
+        for pubdate, aggregated in merge_newest_first(streams):
+            guid = aggregated.source.get_item_guid(aggregated.item)
+            if guid in seen:
+                continue
+            seen[guid] = True
+            yield aggregated
+
+    def get_surrogate_keys(self, obj, items):
+        return super(AggregateFeed, self).get_surrogate_keys(obj, [i.item for i in items])
+
+    def resolve_item(self, item, request, current_site, templates, omit=(), state=None):
+        return item.source.resolve_item(item.item, request, current_site, item.templates,
+                                        omit, state)
+
+    def item_extra_kwargs(self, item):
+        return item.source.item_extra_kwargs(item.item)
@@ -0,0 +1,83 @@
+"""
+Benchmarks writing feeds with large item descriptions, escaped and as CDATA.
+
+Usage::
+
+    $ python -m syndication.benchmark --items 50 --size 100000 --repeat 5
+
+Prints the best time taken to write each feed type in each mode, and the
+size of the output. Nothing but the feed generators is involved, so no
+settings are needed.
+"""
+import datetime
+import optparse
+import sys
+import time
+
+from syndication import feedgenerator
+
+FEED_TYPES = (
+    ('rss2', feedgenerator.Rss201rev2Feed),
+    ('atom', feedgenerator.Atom1Feed),
+)
+
+PARAGRAPH = (u'<p>Some <b>bold</b> text &amp; a <a href="http://example.com/?a=1&amp;b=2">'
+             u'link</a>, with "quotes" and an <code>]]&gt;</code>.</p>\n')
+
+
+class NullFile(object):
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def build_feed(feed_type, items, size, cdata_threshold):
+    feed = feed_type(title=u'Benchmark', link=u'http://example.com/',
+                     feed_url=u'http://example.com/feed/',
+                     description=u'Feed with large descriptions.')
+    feed.cdata_threshold = cdata_threshold
+    description = (PARAGRAPH * (size / len(PARAGRAPH) + 1))[:size]
+    start = datetime.datetime(2010, 1, 1)
+    for i in xrange(items):
+        feed.add_item(title=u'Item %d' % i, link=u'http://example.com/%d/' % i,
+                      description=description, pubdate=start + datetime.timedelta(hours=i),
+                      unique_id=u'http://example.com/%d/' % i)
+    return feed
+
+
+def benchmark(feed, repeat):
+    """
+    Returns the best time taken to write feed, and the size of the output.
+    """
+    best = None
+    for i in range(repeat):
+        outfile = NullFile()
+        start = time.time()
+        feed.write(outfile, 'utf-8')
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, outfile.size
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--items', type='int', default=50,
+                      help='Number of items per feed [%default].')
+    parser.add_option('--size', type='int', default=100000,
+                      help='Size of each description in characters [%default].')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='Number of runs; the best is reported [%default].')
+    options, args = parser.parse_args(argv)
+    print '%-6s %-8s %10s %12s' % ('type', 'mode', 'ms', 'bytes')
+    for name, feed_type in FEED_TYPES:
+        for mode, threshold in (('escaped', None), ('cdata', 0)):
+            feed = build_feed(feed_type, options.items, options.size, threshold)
+            elapsed, size = benchmark(feed, options.repeat)
+            print '%-6s %-8s %10.1f %12d' % (name, mode, elapsed * 1000, size)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
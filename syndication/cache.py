@@ -0,0 +1,97 @@
+"""
+Storage for generated feed bodies.
+
+A store is any object with ``get(key)`` and ``set(key, entry)`` methods, where
+entries are CachedFeed instances. Feed views use a store to serve a body
+generated earlier instead of running get_feed() again; see the
+``feed_cache`` attribute of syndication.views.Feed.
+"""
+import threading
+import time
+
+from django.http import HttpResponse
+
+
+class CachedFeed(object):
+    """
+    A generated feed body. expires is the time (as returned by time.time())
+    until which the body is fresh; None means it is never fresh, and is
+    only served while another request is regenerating it. headers is a list
+    of (name, value) tuples of other response headers to send with it.
+    """
+    def __init__(self, body, content_type, created=None, expires=None, headers=()):
+        self.body = body
+        self.content_type = content_type
+        if created is None:
+            created = time.time()
+        self.created = created
+        self.expires = expires
+        self.headers = list(headers)
+
+    def is_fresh(self, now=None):
+        if self.expires is None:
+            return False
+        if now is None:
+            now = time.time()
+        return now < self.expires
+
+    def is_usable_stale(self, window, now=None):
+        """
+        Returns True if the body is at most window seconds past its expiry
+        time.
+        """
+        if now is None:
+            now = time.time()
+        expires = self.expires
+        if expires is None:
+            expires = self.created
+        return now < expires + window
+
+    def response(self):
+        response = HttpResponse(self.body, content_type=self.content_type)
+        for name, value in self.headers:
+            response[name] = value
+        return response
+
+
+class MemoryStore(object):
+    """
+    A thread-safe in-process store. Once it holds more than max_entries
+    bodies, the least recently stored ones are dropped.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, entry):
+        self.lock.acquire()
+        try:
+            self.entries[key] = entry
+            if len(self.entries) > self.max_entries:
+                oldest = [(e.created, k) for k, e in self.entries.items()]
+                oldest.sort()
+                for created, k in oldest[:len(self.entries) - self.max_entries]:
+                    del self.entries[k]
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+# Used by feeds that have a regeneration_lock but no feed_cache of their own.
+default_store = MemoryStore()
@@ -0,0 +1,113 @@
+"""
+Enclosures for media files stored on the local filesystem.
+
+Set the ``enclosure_resolver`` attribute of a syndication.views.Feed to an
+EnclosureResolver and define ``item_enclosure_path`` instead of the
+``item_enclosure_*`` hooks; the length and MIME type of each file are then
+looked up once and reused until the file's modification time changes.
+"""
+import logging
+import mimetypes
+import os
+import threading
+import time
+import urllib
+
+from django.utils.encoding import smart_str, smart_unicode
+
+from syndication import feedgenerator
+
+logger = logging.getLogger('syndication')
+
+
+class EnclosureResolver(object):
+    """
+    Builds feedgenerator.Enclosure objects for files under root, served at
+    base_url.
+
+    The size and MIME type of each file are cached by path along with its
+    modification time. A cached file is stat()ed again at most once every
+    check_interval seconds, so a feed whose media doesn't change costs no
+    system calls at all between checks. Files that don't exist are cached
+    too, and get no enclosure.
+    """
+    def __init__(self, root, base_url, check_interval=60, max_entries=10000,
+                 default_mime_type='application/octet-stream'):
+        self.root = root
+        self.base_url = base_url
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.default_mime_type = default_mime_type
+        # Maps paths to (checked, mtime, length, mime_type) tuples; mtime is
+        # None for files that don't exist.
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = 0
+
+    def full_path(self, path):
+        return os.path.join(self.root, smart_str(path).lstrip('/'))
+
+    def url(self, path):
+        return smart_unicode(self.base_url + urllib.quote(smart_str(path).lstrip('/')))
+
+    def lookup(self, path, now=None):
+        """
+        Returns a (length, mime_type) tuple for the file at path, relative to
+        root, or None if there is no such file.
+        """
+        if now is None:
+            now = time.time()
+        entry = self.entries.get(path)
+        if entry is not None and now < entry[0] + self.check_interval:
+            return self.result(entry)
+        self.stats += 1
+        try:
+            st = os.stat(self.full_path(path))
+        except OSError:
+            logger.warning('Enclosure %s does not exist.', path)
+            entry = (now, None, None, None)
+        else:
+            if entry is not None and entry[1] == st.st_mtime and entry[2] == st.st_size:
+                entry = (now,) + entry[1:]
+            else:
+                mime_type = mimetypes.guess_type(path)[0] or self.default_mime_type
+                entry = (now, st.st_mtime, st.st_size, mime_type)
+        self.store(path, entry)
+        return self.result(entry)
+
+    def result(self, entry):
+        if entry[1] is None:
+            return None
+        return entry[2], entry[3]
+
+    def store(self, path, entry):
+        self.lock.acquire()
+        try:
+            if path not in self.entries and len(self.entries) >= self.max_entries:
+                # Forget the entries checked longest ago.
+                oldest = [(e[0], p) for p, e in self.entries.items()]
+                oldest.sort()
+                for checked, p in oldest[:max(len(oldest) / 10, 1)]:
+                    del self.entries[p]
+            self.entries[path] = entry
+        finally:
+            self.lock.release()
+
+    def enclosure(self, path):
+        """
+        Returns a feedgenerator.Enclosure for the file at path, relative to
+        root, or None if there is no such file.
+        """
+        found = self.lookup(path)
+        if found is None:
+            return None
+        length, mime_type = found
+        return feedgenerator.Enclosure(self.url(path), unicode(length),
+                                       smart_unicode(mime_type))
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
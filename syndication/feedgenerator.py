@@ -15,14 +15,27 @@ Sample usage:
 >>> feed.write(fp, 'utf-8')
 >>> fp.close()
 
+Feeds can also be generated in one go from plain dictionaries, without
+configured settings:
+
+>>> from syndication import feedgenerator
+>>> xml = feedgenerator.generate(feedgenerator.Atom1Feed, [
+...     {'title': u'Hello', 'link': u'http://www.holovaty.com/test/', 'description': u'Testing.'},
+... ], title=u'Tidbits', link=u'http://www.poynter.org/', description=u'A group weblog.')
+
 For definitions of the different versions of RSS, see:
 http://diveintomark.org/archives/2004/02/04/incompatible-rss
 """
 
+import codecs
 import datetime
+import logging
 import urlparse
 from django.utils.xmlutils import SimplerXMLGenerator
 from django.utils.encoding import force_unicode, iri_to_uri
+from syndication import metrics
+
+logger = logging.getLogger('syndication')
 
 def rfc2822_date(date):
     # We do this ourselves to be timezone aware, email.Utils is not tz aware.
@@ -63,12 +76,86 @@ def get_tag_uri(url, date):
         d = ',%s' % date.strftime('%Y-%m-%d')
     return u'tag:%s%s:%s/%s' % (hostname, d, path, fragment)
 
+def _to_unicode(s):
+    return force_unicode(s, strings_only=True)
+
+def _trusted_unicode(s):
+    # Trusted values are expected to be unicode (or None) already, so a type
+    # check is enough to skip the conversion.
+    if s is None or isinstance(s, unicode):
+        return s
+    return force_unicode(s, strings_only=True)
+
+def _trusted_uri(iri):
+    # iri_to_uri() returns a bytestring, so a trusted link that is already a
+    # str has been through it once and doesn't need another pass.
+    if iri is None or isinstance(iri, str):
+        return iri
+    return iri_to_uri(iri)
+
+class ByteCounter(object):
+    "Wraps a file-like object and counts the bytes written to it"
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        self.outfile.write(data)
+
+class HeaderCapture(object):
+    "Collects the header written by a feed generator, noting where the date goes"
+    def __init__(self):
+        self.chunks = []
+        self.split = None
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def mark(self):
+        self.split = len(self.chunks)
+
 class SyndicationFeed(object):
     "Base class for all syndication feeds. Subclasses should provide write()"
+    # Approximate limit on the size of the output in bytes. Items stop being
+    # written at the first item boundary after the limit has been reached,
+    # so the document is always closed properly.
+    max_bytes = None
+    # Set to True if items were left out because of max_bytes or an item
+    # limit in the caller.
+    truncated = False
+    # The output of start_root() and add_root_elements() as a (prefix,
+    # suffix) tuple of unicode strings split where add_date_element() writes
+    # the date (and, in RSS, the ttl), as returned by capture_header(). If set, write() uses it
+    # instead of writing the header element by element.
+    header = None
+    capture = None
+    # Item descriptions of at least this many characters are written as
+    # CDATA sections rather than escaped, which is quicker and smaller for
+    # large HTML descriptions. Only used for UTF-8 output.
+    cdata_threshold = None
+    use_cdata = False
+    # The names of the __init__() and add_item() arguments the generator
+    # writes, so callers can skip working out the others. None means all of
+    # them. Subclasses that write more should extend these.
+    feed_fields = None
+    item_fields = None
+    # Set by count_bytes(). Generators whose write() doesn't call it are
+    # neither limited by max_bytes nor counted in the metrics.
+    byte_counter = None
+    items_written = 0
+
     def __init__(self, title, link, description, language=None, author_email=None,
             author_name=None, author_link=None, subtitle=None, categories=None,
-            feed_url=None, feed_copyright=None, feed_guid=None, ttl=None, **kwargs):
-        to_unicode = lambda s: force_unicode(s, strings_only=True)
+            feed_url=None, feed_copyright=None, feed_guid=None, ttl=None,
+            trusted=False, **kwargs):
+        # In trusted mode the caller guarantees that text values are already
+        # unicode and links have already been passed through iri_to_uri().
+        self.trusted = trusted
+        if trusted:
+            to_unicode, to_uri = _trusted_unicode, _trusted_uri
+        else:
+            to_unicode, to_uri = _to_unicode, iri_to_uri
         if categories:
             categories = [force_unicode(c) for c in categories]
         if ttl is not None:
@@ -76,15 +163,15 @@ class SyndicationFeed(object):
             ttl = force_unicode(ttl)
         self.feed = {
             'title': to_unicode(title),
-            'link': iri_to_uri(link),
+            'link': to_uri(link),
             'description': to_unicode(description),
             'language': to_unicode(language),
             'author_email': to_unicode(author_email),
             'author_name': to_unicode(author_name),
-            'author_link': iri_to_uri(author_link),
+            'author_link': to_uri(author_link),
             'subtitle': to_unicode(subtitle),
             'categories': categories or (),
-            'feed_url': iri_to_uri(feed_url),
+            'feed_url': to_uri(feed_url),
             'feed_copyright': to_unicode(feed_copyright),
             'id': feed_guid or link,
             'ttl': ttl,
@@ -101,7 +188,10 @@ class SyndicationFeed(object):
         objects except pubdate, which is a datetime.datetime object, and
         enclosure, which is an instance of the Enclosure class.
         """
-        to_unicode = lambda s: force_unicode(s, strings_only=True)
+        if self.trusted:
+            to_unicode, to_uri = _trusted_unicode, _trusted_uri
+        else:
+            to_unicode, to_uri = _to_unicode, iri_to_uri
         if categories:
             categories = [to_unicode(c) for c in categories]
         if ttl is not None:
@@ -109,11 +199,11 @@ class SyndicationFeed(object):
             ttl = force_unicode(ttl)
         item = {
             'title': to_unicode(title),
-            'link': iri_to_uri(link),
+            'link': to_uri(link),
             'description': to_unicode(description),
             'author_email': to_unicode(author_email),
             'author_name': to_unicode(author_name),
-            'author_link': iri_to_uri(author_link),
+            'author_link': to_uri(author_link),
             'pubdate': pubdate,
             'comments': to_unicode(comments),
             'unique_id': to_unicode(unique_id),
@@ -125,6 +215,135 @@ class SyndicationFeed(object):
         item.update(kwargs)
         self.items.append(item)
 
+    def count_bytes(self, outfile):
+        """
+        Returns outfile wrapped in a ByteCounter if the output is limited by
+        max_bytes or metrics are collected, otherwise returns outfile
+        unchanged. Called from write().
+        """
+        self.items_written = 0
+        if self.max_bytes is None and not metrics.registry.enabled:
+            self.byte_counter = None
+            return outfile
+        self.byte_counter = ByteCounter(outfile)
+        return self.byte_counter
+
+    def start_document(self, handler, encoding):
+        """
+        Starts the document. Called from write().
+        """
+        self.use_cdata = (self.cdata_threshold is not None
+                          and codecs.lookup(encoding).name == 'utf-8')
+        handler.startDocument()
+
+    def add_description_element(self, handler, name, description, attrs=None):
+        """
+        Adds an element containing an item's description, as a CDATA section
+        if it is longer than cdata_threshold.
+        """
+        if not self.use_cdata or len(description) < self.cdata_threshold:
+            handler.addQuickElement(name, description, attrs)
+            return
+        handler.startElement(name, attrs or {})
+        # A CDATA section can't contain "]]>", so split it there.
+        handler.ignorableWhitespace(u'<![CDATA[%s]]>' % description.replace(u']]>', u']]]]><![CDATA[>'))
+        handler.endElement(name)
+
+    def add_fragment(self, fragment, pubdate=None):
+        """
+        Adds an item serialized earlier by item_fragment(), which is written
+        as it is. pubdate is the item's pubdate, used for the feed's date.
+        """
+        self.items.append({'fragment': fragment, 'pubdate': pubdate})
+
+    def item_fragment(self, item):
+        """
+        Returns item, one of the dictionaries in items, serialized as a
+        unicode string for add_fragment().
+        """
+        from StringIO import StringIO
+        s = StringIO()
+        handler = SimplerXMLGenerator(s, 'utf-8')
+        self.use_cdata = self.cdata_threshold is not None
+        self.write_item(handler, item)
+        return s.getvalue().decode('utf-8')
+
+    def write_items(self, handler):
+        """
+        Writes the items, including those added with add_fragment(). Called
+        from write().
+        """
+        for item in self.budgeted_items():
+            if 'fragment' in item:
+                handler.ignorableWhitespace(item['fragment'])
+            else:
+                self.write_item(handler, item)
+
+    def write_item(self, handler, item):
+        """
+        Writes one item. Subclasses should override this.
+        """
+        raise NotImplementedError
+
+    def budgeted_items(self):
+        """
+        Yields the items to write, stopping at the first item boundary after
+        max_bytes have been written.
+        """
+        counter = self.byte_counter
+        for i, item in enumerate(self.items):
+            if counter is not None:
+                if self.max_bytes is not None and counter.count >= self.max_bytes:
+                    self.truncated = True
+                    logger.warning('Feed %s truncated to %d of %d items after %d bytes.',
+                                   self.feed['link'], i, len(self.items), counter.count)
+                    break
+                self.items_written += 1
+            yield item
+
+    def write_header(self, handler):
+        """
+        Writes the root element's start tag and the header elements, using
+        header if it is set. Called from write().
+        """
+        if self.header is None:
+            self.start_root(handler)
+            self.add_root_elements(handler)
+        else:
+            prefix, suffix = self.header
+            handler.ignorableWhitespace(prefix)
+            self.add_date_element(handler)
+            handler.ignorableWhitespace(suffix)
+
+    def capture_header(self):
+        """
+        Returns the header written by write_header() as a (prefix, suffix)
+        tuple to be used as header by other generators for the same feed, or
+        None if the generator didn't write the date with add_date_element().
+        """
+        self.capture = HeaderCapture()
+        try:
+            handler = SimplerXMLGenerator(self.capture, 'utf-8')
+            self.start_root(handler)
+            self.add_root_elements(handler)
+        finally:
+            capture, self.capture = self.capture, None
+        if capture.split is None:
+            return None
+        return (''.join(capture.chunks[:capture.split]).decode('utf-8'),
+                ''.join(capture.chunks[capture.split:]).decode('utf-8'))
+
+    def record_write(self):
+        """
+        Adds the bytes and items written to syndication.metrics. Called at
+        the end of write().
+        """
+        if self.byte_counter is None:
+            return
+        labels = (('feed_type', metrics.class_name(self.__class__)),)
+        metrics.registry.inc('syndication_written_bytes_total', labels, self.byte_counter.count)
+        metrics.registry.inc('syndication_written_items_total', labels, self.items_written)
+
     def num_items(self):
         return len(self.items)
 
@@ -191,25 +410,29 @@ class Enclosure(object):
 
 class RssFeed(SyndicationFeed):
     mime_type = 'application/rss+xml'
+    feed_fields = frozenset(['title', 'link', 'description', 'feed_url', 'language',
+                             'categories', 'feed_copyright', 'ttl'])
     def write(self, outfile, encoding):
-        handler = SimplerXMLGenerator(outfile, encoding)
-        handler.startDocument()
-        handler.startElement(u"rss", self.rss_attributes())
-        handler.startElement(u"channel", self.root_attributes())
-        self.add_root_elements(handler)
+        handler = SimplerXMLGenerator(self.count_bytes(outfile), encoding)
+        self.start_document(handler, encoding)
+        self.write_header(handler)
         self.write_items(handler)
         self.endChannelElement(handler)
         handler.endElement(u"rss")
+        self.record_write()
+
+    def start_root(self, handler):
+        handler.startElement(u"rss", self.rss_attributes())
+        handler.startElement(u"channel", self.root_attributes())
 
     def rss_attributes(self):
         return {u"version": self._version,
                 u"xmlns:atom": u"http://www.w3.org/2005/Atom"}
 
-    def write_items(self, handler):
-        for item in self.items:
-            handler.startElement(u'item', self.item_attributes(item))
-            self.add_item_elements(handler, item)
-            handler.endElement(u"item")
+    def write_item(self, handler, item):
+        handler.startElement(u'item', self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement(u"item")
 
     def add_root_elements(self, handler):
         handler.addQuickElement(u"title", self.feed['title'])
@@ -222,7 +445,15 @@ class RssFeed(SyndicationFeed):
             handler.addQuickElement(u"category", cat)
         if self.feed['feed_copyright'] is not None:
             handler.addQuickElement(u"copyright", self.feed['feed_copyright'])
+        self.add_date_element(handler)
+
+    def add_date_element(self, handler):
+        if self.capture is not None:
+            self.capture.mark()
+            return
         handler.addQuickElement(u"lastBuildDate", rfc2822_date(self.latest_post_date()).decode('utf-8'))
+        # The ttl may be worked out from the items too (see
+        # syndication.views.Feed.adaptive_ttl).
         if self.feed['ttl'] is not None:
             handler.addQuickElement(u"ttl", self.feed['ttl'])
 
@@ -231,20 +462,25 @@ class RssFeed(SyndicationFeed):
 
 class RssUserland091Feed(RssFeed):
     _version = u"0.91"
+    # The pubdates go into lastBuildDate.
+    item_fields = frozenset(['title', 'link', 'description', 'pubdate'])
     def add_item_elements(self, handler, item):
         handler.addQuickElement(u"title", item['title'])
         handler.addQuickElement(u"link", item['link'])
         if item['description'] is not None:
-            handler.addQuickElement(u"description", item['description'])
+            self.add_description_element(handler, u"description", item['description'])
 
 class Rss201rev2Feed(RssFeed):
     # Spec: http://blogs.law.harvard.edu/tech/rss
     _version = u"2.0"
+    item_fields = frozenset(['title', 'link', 'description', 'author_name', 'author_email',
+                             'pubdate', 'comments', 'unique_id', 'ttl', 'enclosure',
+                             'categories'])
     def add_item_elements(self, handler, item):
         handler.addQuickElement(u"title", item['title'])
         handler.addQuickElement(u"link", item['link'])
         if item['description'] is not None:
-            handler.addQuickElement(u"description", item['description'])
+            self.add_description_element(handler, u"description", item['description'])
 
         # Author information.
         if item["author_name"] and item["author_email"]:
@@ -278,14 +514,23 @@ class Atom1Feed(SyndicationFeed):
     # Spec: http://atompub.org/2005/07/11/draft-ietf-atompub-format-10.html
     mime_type = 'application/atom+xml'
     ns = u"http://www.w3.org/2005/Atom"
+    feed_fields = frozenset(['title', 'link', 'description', 'feed_url', 'feed_guid',
+                             'language', 'author_name', 'author_email', 'author_link',
+                             'subtitle', 'categories', 'feed_copyright'])
+    item_fields = frozenset(['title', 'link', 'description', 'author_name', 'author_email',
+                             'author_link', 'pubdate', 'unique_id', 'enclosure',
+                             'categories', 'item_copyright'])
 
     def write(self, outfile, encoding):
-        handler = SimplerXMLGenerator(outfile, encoding)
-        handler.startDocument()
-        handler.startElement(u'feed', self.root_attributes())
-        self.add_root_elements(handler)
+        handler = SimplerXMLGenerator(self.count_bytes(outfile), encoding)
+        self.start_document(handler, encoding)
+        self.write_header(handler)
         self.write_items(handler)
         handler.endElement(u"feed")
+        self.record_write()
+
+    def start_root(self, handler):
+        handler.startElement(u'feed', self.root_attributes())
 
     def root_attributes(self):
         if self.feed['language'] is not None:
@@ -299,7 +544,7 @@ class Atom1Feed(SyndicationFeed):
         if self.feed['feed_url'] is not None:
             handler.addQuickElement(u"link", "", {u"rel": u"self", u"href": self.feed['feed_url']})
         handler.addQuickElement(u"id", self.feed['id'])
-        handler.addQuickElement(u"updated", rfc3339_date(self.latest_post_date()).decode('utf-8'))
+        self.add_date_element(handler)
         if self.feed['author_name'] is not None:
             handler.startElement(u"author", {})
             handler.addQuickElement(u"name", self.feed['author_name'])
@@ -315,11 +560,16 @@ class Atom1Feed(SyndicationFeed):
         if self.feed['feed_copyright'] is not None:
             handler.addQuickElement(u"rights", self.feed['feed_copyright'])
 
-    def write_items(self, handler):
-        for item in self.items:
-            handler.startElement(u"entry", self.item_attributes(item))
-            self.add_item_elements(handler, item)
-            handler.endElement(u"entry")
+    def add_date_element(self, handler):
+        if self.capture is not None:
+            self.capture.mark()
+            return
+        handler.addQuickElement(u"updated", rfc3339_date(self.latest_post_date()).decode('utf-8'))
+
+    def write_item(self, handler, item):
+        handler.startElement(u"entry", self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement(u"entry")
 
     def add_item_elements(self, handler, item):
         handler.addQuickElement(u"title", item['title'])
@@ -346,7 +596,7 @@ class Atom1Feed(SyndicationFeed):
 
         # Summary.
         if item['description'] is not None:
-            handler.addQuickElement(u"summary", item['description'], {u"type": u"html"})
+            self.add_description_element(handler, u"summary", item['description'], {u"type": u"html"})
 
         # Enclosure.
         if item['enclosure'] is not None:
@@ -367,3 +617,27 @@ class Atom1Feed(SyndicationFeed):
 # This isolates the decision of what the system default is, so calling code can
 # do "feedgenerator.DefaultFeed" instead of "feedgenerator.Rss201rev2Feed".
 DefaultFeed = Rss201rev2Feed
+
+def populate(feed, items, max_items=None):
+    """
+    Adds items, an iterable of dictionaries of add_item() keyword arguments,
+    to feed and returns it. At most max_items items are added.
+    """
+    for i, item in enumerate(items):
+        if max_items is not None and i >= max_items:
+            feed.truncated = True
+            break
+        feed.add_item(**item)
+    return feed
+
+def generate(feed_type, items, outfile=None, encoding='utf-8', max_items=None, **kwargs):
+    """
+    Creates a feed_type generator with the keyword arguments, adds items
+    with populate() and writes the feed to outfile, or returns it as a
+    string if outfile is None. Needs neither settings nor the rest of
+    Django, so it suits batch jobs.
+    """
+    feed = populate(feed_type(**kwargs), items, max_items)
+    if outfile is None:
+        return feed.writeString(encoding)
+    feed.write(outfile, encoding)
@@ -13,10 +13,36 @@ class Feed(views.Feed):
                       category=PendingDeprecationWarning)
 
         self.slug = slug
+        self.title_template, self.description_template = self.template_names(slug)
+        self.bind(request)
+
+    def bind(self, request):
+        """
+        Points the feed at request, so the deprecated feed() view can reuse
+        one instance for many requests.
+        """
         self.request = request
+        # Forget the previous request's path, but keep a feed_url defined on
+        # the class.
+        self.__dict__.pop('feed_url', None)
         self.feed_url = getattr(self, 'feed_url', None) or request.path
-        self.title_template = self.title_template or ('feeds/%s_title.html' % slug)
-        self.description_template = self.description_template or ('feeds/%s_description.html' % slug)
+
+    @classmethod
+    def reusable(cls):
+        """
+        Returns True if instances can be reused with bind(), which is
+        assumed not to be the case for subclasses that override __init__().
+        """
+        return cls.__init__.im_func is Feed.__init__.im_func
+
+    @classmethod
+    def template_names(cls, slug):
+        """
+        Returns the names of the title and description templates used for
+        this feed when it is registered under slug.
+        """
+        return (cls.title_template or ('feeds/%s_title.html' % slug),
+                cls.description_template or ('feeds/%s_description.html' % slug))
 
     def get_object(self, bits):
         return None
@@ -0,0 +1,390 @@
+"""
+Load testing tool for the syndication views.
+
+Serves the test URLconf (syndication.tests.load_urls: the feeds from
+syndication/tests/urls.py plus synthetic feeds of any size) from forked,
+in-process WSGI servers sharing one listening socket, drives it with
+concurrent clients and reports throughput, latency percentiles and memory use
+per worker. Everything runs locally; no network access is needed.
+
+Usage::
+
+    $ python -m syndication.loadtest --workers 2 --concurrency 16 \\
+          --requests 2000 --mix /rss2/=4,/atom/=2,/large/500/=1 \\
+          --conditional 0.5
+
+Paths in ``--mix`` take an optional ``=weight``. ``--conditional`` is the
+fraction of requests that replay the ``ETag``/``Last-Modified`` validators
+of the previous response for the same path as a conditional GET.
+"""
+import httplib
+import math
+import optparse
+import os
+import random
+import resource
+import signal
+import socket
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+DEFAULT_MIX = '/rss2/=4,/atom/=2,/rss091/=1,/depr-feeds/rss/=1,/large/200/=1'
+
+
+def parse_mix(value):
+    """
+    Parses a request mix such as "/rss2/=3,/atom/" into a list of
+    (path, weight) tuples.
+    """
+    mix = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '=' in part:
+            path, weight = part.rsplit('=', 1)
+            weight = int(weight)
+        else:
+            path, weight = part, 1
+        if not path.startswith('/') or weight < 1:
+            raise ValueError('Invalid request mix entry: %r' % part)
+        mix.append((path, weight))
+    if not mix:
+        raise ValueError('The request mix is empty.')
+    return mix
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a sorted list of values, or None
+    if the list is empty.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(rank, 0)]
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes.
+    """
+    try:
+        f = open('/proc/self/statm')
+        try:
+            pages = int(f.read().split()[1])
+        finally:
+            f.close()
+    except (IOError, IndexError, ValueError):
+        return 0
+    return pages * resource.getpagesize()
+
+
+def setup_environment(options):
+    """
+    Configures the test settings to serve the load test URLconf from a
+    temporary SQLite database that forked workers can share.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'syndication.tests.settings')
+    from django.conf import settings
+    from django.core.management import call_command
+
+    fd, db_name = tempfile.mkstemp(prefix='syndication-loadtest-', suffix='.db')
+    os.close(fd)
+    settings.DATABASE_NAME = db_name
+    settings.ROOT_URLCONF = 'syndication.tests.load_urls'
+    settings.DEBUG = settings.TEMPLATE_DEBUG = False
+    settings.USE_ETAGS = options.etags
+    settings.MIDDLEWARE_CLASSES = (
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.http.ConditionalGetMiddleware',
+    )
+    call_command('syncdb', verbosity=0, interactive=False)
+    call_command('loaddata', 'test_entries', verbosity=0)
+    return db_name
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class Worker(object):
+    """
+    A forked server process. Reports its request count and memory usage
+    through a pipe when it is terminated.
+    """
+    def __init__(self, server, report_fd):
+        self.server = server
+        self.report_fd = report_fd
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def run(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        handler = WSGIHandler()
+
+        def application(environ, start_response):
+            self.lock.acquire()
+            try:
+                self.requests += 1
+            finally:
+                self.lock.release()
+            return handler(environ, start_response)
+
+        self.rss_start = current_rss()
+        signal.signal(signal.SIGTERM, self.terminate)
+        self.server.set_app(application)
+        try:
+            self.server.serve_forever()
+        finally:
+            os._exit(1)
+
+    def terminate(self, signum, frame):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        os.write(self.report_fd, '%d %d %d %d %d\n' % (os.getpid(),
+            self.requests, self.rss_start, current_rss(), max_rss))
+        os._exit(0)
+
+
+def start_workers(options):
+    """
+    Binds the listening socket and forks the server processes. Returns the
+    bound address, the worker pids and the read end of the report pipe.
+    """
+    from django.db import connection
+    if options.threaded:
+        server_class = ThreadingWSGIServer
+    else:
+        server_class = WSGIServer
+    server = server_class(('127.0.0.1', options.port), QuietRequestHandler)
+    # Each worker must open its own database connection.
+    connection.close()
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for i in range(options.workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            Worker(server, write_fd).run()
+        pids.append(pid)
+    os.close(write_fd)
+    address = server.server_address
+    server.server_close()
+    return address, pids, read_fd
+
+
+def stop_workers(pids, read_fd):
+    """
+    Terminates the workers and returns their reports.
+    """
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    data = ''
+    while True:
+        chunk = os.read(read_fd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    os.close(read_fd)
+    reports = []
+    for line in data.splitlines():
+        pid, requests, rss_start, rss_end, max_rss = [int(v) for v in line.split()]
+        reports.append({'pid': pid, 'requests': requests, 'rss_start': rss_start,
+                        'rss_end': rss_end, 'max_rss': max_rss})
+    return reports
+
+
+class Client(threading.Thread):
+    """
+    Issues requests from the mix until the shared budget is exhausted.
+    """
+    def __init__(self, address, paths, options, budget, results):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.address = address
+        self.paths = paths
+        self.conditional = options.conditional
+        self.budget = budget
+        self.results = results
+        self.random = random.Random(options.seed + len(results))
+        self.validators = {}
+        self.samples = []
+        results.append(self.samples)
+
+    def run(self):
+        while self.budget.take():
+            path = self.random.choice(self.paths)
+            headers = {}
+            conditional = (path in self.validators and
+                           self.random.random() < self.conditional)
+            if conditional:
+                etag, last_modified = self.validators[path]
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+            start = time.time()
+            try:
+                conn = httplib.HTTPConnection(*self.address)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                finally:
+                    conn.close()
+            except (socket.error, httplib.HTTPException):
+                self.samples.append((path, time.time() - start, 'error', 0))
+                continue
+            self.samples.append((path, time.time() - start, response.status, len(body)))
+            if response.status == 200:
+                self.validators[path] = (response.getheader('etag'),
+                                         response.getheader('last-modified'))
+
+
+class Budget(object):
+    """
+    Thread-safe request budget, bounded by a count or a deadline.
+    """
+    def __init__(self, requests=None, duration=None):
+        self.remaining = requests
+        self.deadline = duration and (time.time() + duration)
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.deadline is not None:
+            return time.time() < self.deadline
+        self.lock.acquire()
+        try:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+        finally:
+            self.lock.release()
+
+
+def run_clients(address, paths, options, requests=None, duration=None):
+    budget = Budget(requests, duration)
+    results = []
+    clients = [Client(address, paths, options, budget, results)
+               for i in range(options.concurrency)]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start
+    samples = []
+    for client_samples in results:
+        samples.extend(client_samples)
+    return samples, elapsed
+
+
+def format_ms(seconds):
+    if seconds is None:
+        return '-'
+    return '%.1f' % (seconds * 1000)
+
+
+def report(samples, elapsed, workers, out=sys.stdout):
+    latencies = [s[1] for s in samples]
+    latencies.sort()
+    statuses = {}
+    total_bytes = 0
+    by_path = {}
+    for path, latency, status, size in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+        total_bytes += size
+        by_path.setdefault(path, []).append(latency)
+
+    out.write('Requests:     %d in %.2fs\n' % (len(samples), elapsed))
+    if elapsed:
+        out.write('Throughput:   %.1f req/s\n' % (len(samples) / elapsed))
+    out.write('Latency (ms): p50 %s  p95 %s  p99 %s  max %s\n' % (
+        format_ms(percentile(latencies, 50)), format_ms(percentile(latencies, 95)),
+        format_ms(percentile(latencies, 99)), format_ms(latencies and latencies[-1] or None)))
+    codes = statuses.keys()
+    codes.sort()
+    out.write('Statuses:     %s\n' % ', '.join(['%s: %d' % (c, statuses[c]) for c in codes]))
+    out.write('Transferred:  %.2f MB\n' % (total_bytes / 1048576.0))
+
+    out.write('\n%-32s %8s %10s %10s %10s\n' % ('Path', 'Requests', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+    paths = by_path.keys()
+    paths.sort()
+    for path in paths:
+        values = by_path[path]
+        values.sort()
+        out.write('%-32s %8d %10s %10s %10s\n' % (path, len(values),
+            format_ms(percentile(values, 50)), format_ms(percentile(values, 95)),
+            format_ms(percentile(values, 99))))
+
+    out.write('\n%-8s %8s %14s %14s %14s\n' % ('Worker', 'Requests', 'RSS start (MB)', 'RSS end (MB)', 'Max RSS (MB)'))
+    for worker in workers:
+        out.write('%-8d %8d %14.1f %14.1f %14.1f\n' % (worker['pid'], worker['requests'],
+            worker['rss_start'] / 1048576.0, worker['rss_end'] / 1048576.0,
+            worker['max_rss'] / 1048576.0))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--workers', type='int', default=2,
+        help='number of forked server processes [default: %default]')
+    parser.add_option('--threaded', action='store_true', default=False,
+        help='handle requests in a thread per request within each worker')
+    parser.add_option('--concurrency', type='int', default=8,
+        help='number of concurrent clients [default: %default]')
+    parser.add_option('--requests', type='int', default=1000,
+        help='total number of requests [default: %default]')
+    parser.add_option('--duration', type='float', default=None,
+        help='run for this many seconds instead of a fixed number of requests')
+    parser.add_option('--warmup', type='int', default=0,
+        help='number of unmeasured requests to send first [default: %default]')
+    parser.add_option('--mix', default=DEFAULT_MIX,
+        help='comma separated paths with optional =weight [default: %default]')
+    parser.add_option('--conditional', type='float', default=0.0,
+        help='fraction of requests sent as conditional GETs [default: %default]')
+    parser.add_option('--no-etags', action='store_false', dest='etags', default=True,
+        help="don't generate ETags (USE_ETAGS = False)")
+    parser.add_option('--port', type='int', default=0,
+        help='port to listen on, 0 picks a free one [default: %default]')
+    parser.add_option('--seed', type='int', default=0,
+        help='random seed for the request mix [default: %default]')
+    options, args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(options.mix)
+    except ValueError, e:
+        parser.error(str(e))
+    paths = []
+    for path, weight in mix:
+        paths.extend([path] * weight)
+
+    db_name = setup_environment(options)
+    try:
+        address, pids, read_fd = start_workers(options)
+        try:
+            if options.warmup:
+                run_clients(address, paths, options, requests=options.warmup)
+            samples, elapsed = run_clients(address, paths, options,
+                requests=options.requests, duration=options.duration)
+        finally:
+            workers = stop_workers(pids, read_fd)
+    finally:
+        os.unlink(db_name)
+    report(samples, elapsed, workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Locks used to make sure only one request at a time regenerates a feed.
+
+A lock backend has ``acquire(key, blocking=True)``, which returns True if the
+lock for key was acquired, and ``release(key)``. ThreadLocks works within one
+process; FileLocks also works across processes on the same host.
+"""
+import errno
+import fcntl
+import os
+import threading
+
+from django.utils.hashcompat import md5_constructor
+
+
+class ThreadLocks(object):
+    """
+    Per-key locks shared by the threads of one process.
+    """
+    def __init__(self):
+        self.locks = {}
+        self.mutex = threading.Lock()
+
+    def acquire(self, key, blocking=True):
+        self.mutex.acquire()
+        try:
+            try:
+                lock = self.locks[key]
+            except KeyError:
+                lock = self.locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+        finally:
+            self.mutex.release()
+        if lock[0].acquire(blocking):
+            return True
+        self.forget(key)
+        return False
+
+    def release(self, key):
+        self.locks[key][0].release()
+        self.forget(key)
+
+    def forget(self, key):
+        self.mutex.acquire()
+        try:
+            lock = self.locks[key]
+            lock[1] -= 1
+            if not lock[1]:
+                del self.locks[key]
+        finally:
+            self.mutex.release()
+
+
+class FileLocks(object):
+    """
+    Per-key locks using flock() on files in directory, shared by all threads
+    and processes on the host that use the same directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.local = threading.local()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def path(self, key):
+        return os.path.join(self.directory, md5_constructor(key).hexdigest() + '.lock')
+
+    def acquire(self, key, blocking=True):
+        held = self.local.__dict__.setdefault('held', {})
+        fd = os.open(self.path(key), os.O_RDWR | os.O_CREAT, 0644)
+        flags = fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except IOError, e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        held[key] = fd
+        return True
+
+    def release(self, key):
+        fd = self.local.held.pop(key)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
@@ -0,0 +1,25 @@
+import sys
+from django.core.management.base import NoArgsCommand
+from optparse import make_option
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--urlconf', dest='urlconf', default=None,
+            help='The URLconf to walk. Defaults to the ROOT_URLCONF setting.'),
+        make_option('--render', action='store_true', dest='render', default=False,
+            help='Also render each feed whose URL takes no arguments.'),
+    )
+    help = "Warms up every syndication feed in the URLconf and reports how long each one took."
+
+    def handle_noargs(self, **options):
+        from syndication.warmup import warm_up
+
+        results = warm_up(options.get('urlconf'), render=options.get('render'))
+        total = 0
+        for name, seconds, error in results:
+            total += seconds
+            line = '%8.1f ms  %s' % (seconds * 1000, name)
+            if error is not None:
+                line += '  (failed: %s)' % error
+            sys.stdout.write(line + '\n')
+        sys.stdout.write('Warmed up %d feeds in %.1f ms.\n' % (len(results), total * 1000))
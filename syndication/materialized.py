@@ -0,0 +1,306 @@
+"""
+Feeds that are kept up to date as their items change, instead of being
+assembled when they are requested.
+
+A MaterializedFeed keeps the serialized items of each of its feeds, newest
+first, in a FragmentRing stored in its ``fragment_store``. When an instance
+of one of its ``tracked_models`` is saved or deleted, the item is serialized
+again or removed in the rings of the feeds it belongs to, so serving a feed
+only takes its header and the stored fragments, however expensive the
+item resolvers are.
+"""
+import calendar
+import datetime
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.utils import simplejson, tzinfo
+from django.utils.encoding import smart_str, smart_unicode
+
+from syndication import cache, locks, purge, records, views
+from syndication.warmup import warm_up_request
+
+# The content type of rings kept in a feed store.
+CONTENT_TYPE = 'application/x-syndication-fragments'
+
+logger = logging.getLogger('syndication')
+
+
+def to_timestamp(pubdate):
+    if pubdate is None:
+        return None
+    return calendar.timegm(pubdate.utctimetuple())
+
+
+def from_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    pubdate = datetime.datetime.fromtimestamp(timestamp)
+    return pubdate.replace(tzinfo=tzinfo.LocalTimezone(pubdate))
+
+
+class FragmentRing(object):
+    """
+    The serialized items of a feed as a list of (timestamp, key, fragment)
+    entries ordered newest first, holding at most size entries. Items
+    without a pubdate (timestamp None) come last.
+    """
+    def __init__(self, size, entries=()):
+        self.size = size
+        self.entries = [tuple(entry) for entry in entries][:size]
+
+    def __contains__(self, key):
+        for entry in self.entries:
+            if entry[1] == key:
+                return True
+        return False
+
+    def is_full(self):
+        return len(self.entries) >= self.size
+
+    def remove(self, key):
+        """
+        Removes the item with key. Returns True if it was in the ring.
+        """
+        count = len(self.entries)
+        self.entries = [entry for entry in self.entries if entry[1] != key]
+        return len(self.entries) != count
+
+    def insert(self, timestamp, key, fragment):
+        """
+        Adds or replaces the item with key, dropping the oldest item if the
+        ring is full.
+        """
+        self.remove(key)
+        self.entries.append((timestamp, key, fragment))
+        self.entries.sort(key=lambda entry: (entry[0] is not None, entry[0]), reverse=True)
+        del self.entries[self.size:]
+
+    def dumps(self):
+        return simplejson.dumps(self.entries)
+
+    @classmethod
+    def loads(cls, size, data):
+        return cls(size, simplejson.loads(data))
+
+
+class MaterializedFeed(views.Feed):
+    """
+    A feed served from fragments serialized when its items change.
+
+    Each feed (one per object returned by get_object()) has a ring of up to
+    ring_size items, or max_items if that is smaller. A ring is built from
+    get_items() the first time it is needed; after that, saving or deleting
+    an instance of tracked_models updates the rings of the objects returned
+    by objects_for_item(). Items are serialized with a request for
+    materialized_path on materialized_host, so resolvers mustn't depend on
+    anything else about the request.
+
+    Instances connect to the model signals when they are created, so the
+    feed must be instantiated (e.g. by importing the URLconf) in every
+    process that saves tracked objects. Use a fragment_store shared by those
+    processes, such as a SnapshotStore, and an update_lock that works across
+    them, such as syndication.locks.FileLocks.
+
+    Errors while updating a ring are logged rather than raised, so they
+    don't make saving the object fail; the ring is dropped and built again
+    the next time the feed is requested.
+    """
+    tracked_models = ()
+    fragment_store = None
+    update_lock = None
+    ring_size = 50
+    materialized_path = '/'
+    materialized_host = 'localhost'
+
+    def __init__(self):
+        if self.fragment_store is None:
+            self.fragment_store = cache.default_store
+        if self.update_lock is None:
+            self.update_lock = locks.ThreadLocks()
+        for model in self.tracked_models:
+            post_save.connect(self.item_saved, sender=model)
+            post_delete.connect(self.item_deleted, sender=model)
+
+    def objects_for_item(self, item):
+        """
+        Returns the objects whose feeds item is (or was) in. By default the
+        feed takes no object, so this is [None].
+        """
+        return [None]
+
+    def item_in_feed(self, obj, item):
+        """
+        Returns True if item belongs in the feed for obj, e.g. because it
+        is published.
+        """
+        return True
+
+    def item_key(self, item):
+        """
+        Returns the key of item in rings: its surrogate key if it is a model
+        instance, otherwise its guid prefixed with 'guid:'.
+        """
+        key = purge.surrogate_key(item)
+        if key is None:
+            return u'guid:' + smart_unicode(self.get_item_guid(item))
+        return unicode(key)
+
+    def get_ring_key(self, obj):
+        return smart_str('%s.%s:%s.%s:%r' % (
+            self.__class__.__module__, self.__class__.__name__,
+            self.feed_type.__module__, self.feed_type.__name__,
+            records.object_key(obj)))
+
+    def get_ring_size(self):
+        return views.effective_limit(self.ring_size, views.effective_limit(
+            self.max_items, getattr(settings, 'SYNDICATION_MAX_ITEMS', None)))
+
+    def materialized_request(self, obj):
+        return warm_up_request(self.materialized_path, self.materialized_host)
+
+    def serialize(self, obj, items):
+        """
+        Returns (timestamp, key, fragment) entries for items of the feed for
+        obj.
+        """
+        request = self.materialized_request(obj)
+        state = views.FeedState(request, obj)
+        state.site = views.get_current_site(request)
+        resolve_kwargs = {}
+        if views.accepts_state(self.resolve_item):
+            resolve_kwargs['state'] = state
+        templates = (views.find_template(self.title_template),
+                     views.find_template(self.description_template))
+        omit = self.omitted_item_fields()
+        generator = self.feed_type(title=u'', link=u'', description=u'')
+        generator.cdata_threshold = self.cdata_threshold
+        entries = []
+        for item in items:
+            kwargs = self.resolve_item(item, request, state.site, templates, omit,
+                                       **resolve_kwargs)
+            kwargs.update(self.item_extra_kwargs(item))
+            generator.add_item(**kwargs)
+            entries.append((to_timestamp(kwargs.get('pubdate')), self.item_key(item),
+                            generator.item_fragment(generator.items[-1])))
+        return entries
+
+    def load_ring(self, obj):
+        entry = self.fragment_store.get(self.get_ring_key(obj))
+        if entry is None:
+            return None
+        return FragmentRing.loads(self.get_ring_size(), entry.body)
+
+    def save_ring(self, obj, ring):
+        self.fragment_store.set(self.get_ring_key(obj),
+                                cache.CachedFeed(ring.dumps(), CONTENT_TYPE))
+
+    def build_ring(self, obj):
+        """
+        Builds the ring for obj from get_items() and saves it.
+        """
+        size = self.get_ring_size()
+        ring = FragmentRing(size, self.serialize(obj, self.get_items(obj, size)))
+        self.save_ring(obj, ring)
+        return ring
+
+    def update(self, obj, item, deleted=False):
+        """
+        Updates the ring for obj after item was saved or deleted. Rings that
+        haven't been built yet are left alone.
+        """
+        key = self.get_ring_key(obj)
+        self.update_lock.acquire(key)
+        try:
+            ring = self.load_ring(obj)
+            if ring is None:
+                return
+            item_key = self.item_key(item)
+            full = ring.is_full()
+            if deleted or not self.item_in_feed(obj, item):
+                if not ring.remove(item_key):
+                    return
+            else:
+                existed = item_key in ring
+                for entry in self.serialize(obj, [item]):
+                    ring.insert(*entry)
+                if not existed or item_key in ring:
+                    self.save_ring(obj, ring)
+                    return
+            if full:
+                # An item left a full ring, and only the database knows
+                # which item takes its place.
+                self.build_ring(obj)
+            else:
+                self.save_ring(obj, ring)
+        finally:
+            self.update_lock.release(key)
+
+    def drop_ring(self, obj):
+        """
+        Removes the ring for obj, so it is built again when it is needed.
+        """
+        key = self.get_ring_key(obj)
+        self.update_lock.acquire(key)
+        try:
+            self.fragment_store.delete(key)
+        finally:
+            self.update_lock.release(key)
+
+    def item_changed(self, item, deleted=False):
+        """
+        Updates the rings item is in, dropping those that fail to update.
+        """
+        try:
+            objs = self.objects_for_item(item)
+        except Exception:
+            logger.exception('Finding the feeds of %r for %s.%s failed.', item,
+                             self.__class__.__module__, self.__class__.__name__)
+            return
+        for obj in objs:
+            try:
+                self.update(obj, item, deleted)
+            except Exception:
+                logger.exception('Updating the ring of %s.%s for %r failed; dropping it.',
+                                 self.__class__.__module__, self.__class__.__name__, obj)
+                try:
+                    self.drop_ring(obj)
+                except Exception:
+                    logger.exception('Dropping the ring of %s.%s for %r failed.',
+                                     self.__class__.__module__, self.__class__.__name__, obj)
+
+    def item_saved(self, sender, instance, **kwargs):
+        self.item_changed(instance)
+
+    def item_deleted(self, sender, instance, **kwargs):
+        self.item_changed(instance, deleted=True)
+
+    def get_feed(self, obj, request, items=None, resolved=None, state=None):
+        """
+        Returns the feed generator with the header for obj and the items in
+        its ring, which is built first if needed. Items passed in, and the
+        lite variant, are resolved as usual.
+        """
+        if items is not None or self.lite:
+            return super(MaterializedFeed, self).get_feed(obj, request, items, resolved, state)
+        ring = self.load_ring(obj)
+        if ring is None:
+            key = self.get_ring_key(obj)
+            self.update_lock.acquire(key)
+            try:
+                ring = self.load_ring(obj)
+                if ring is None:
+                    ring = self.build_ring(obj)
+            finally:
+                self.update_lock.release(key)
+        feed = super(MaterializedFeed, self).get_feed(obj, request, (), state=state)
+        for timestamp, key, fragment in ring.entries:
+            feed.add_fragment(fragment, from_timestamp(timestamp))
+        if self.surrogate_key_header is not None:
+            feed.surrogate_keys = self.get_surrogate_keys(obj, []) + [
+                str(entry[1]) for entry in ring.entries if not entry[1].startswith(u'guid:')] + [
+                purge.model_surrogate_key(model) for model in self.tracked_models]
+        if self.adaptive_ttl:
+            self.set_adaptive_ttl(feed)
+        return feed
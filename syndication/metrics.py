@@ -0,0 +1,172 @@
+"""
+Runtime metrics for feeds, in the Prometheus text exposition format.
+
+The feed views and generators update ``registry``; mount ``expose`` in your
+URLconf to publish the numbers::
+
+    (r'^metrics/feeds/$', 'syndication.metrics.expose'),
+
+To count the 304 responses sent for feeds, add
+``syndication.metrics.MetricsMiddleware`` to MIDDLEWARE_CLASSES above
+``django.middleware.http.ConditionalGetMiddleware``. Set ``registry.enabled``
+to False to turn collection off.
+"""
+import threading
+
+# Upper bounds, in seconds, of the buckets of the generation time histogram.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    'syndication_requests_total': ('counter', 'Requests served by feed views.'),
+    'syndication_not_modified_total': ('counter', 'Feed requests answered with 304 Not Modified.'),
+    'syndication_cache_hits_total': ('counter', 'Requests served a fresh body from the feed cache.'),
+    'syndication_cache_stale_total': ('counter', 'Requests served a stale body while the feed was regenerated.'),
+    'syndication_cache_misses_total': ('counter', 'Requests that generated the feed.'),
+    'syndication_items_total': ('counter', 'Items added to feeds by get_feed().'),
+    'syndication_generation_seconds': ('histogram', 'Time taken to generate and write feeds.'),
+    'syndication_written_bytes_total': ('counter', 'Bytes written by feed generators.'),
+    'syndication_written_items_total': ('counter', 'Items written by feed generators.'),
+}
+
+
+def class_name(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def feed_labels(feed):
+    """
+    Returns the labels for a syndication.views.Feed: its class and feed_type.
+    """
+    return (('feed', class_name(feed.__class__)),
+            ('feed_type', class_name(feed.feed_type)))
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, escape_label(value))
+                              for name, value in labels])
+
+
+class Registry(object):
+    """
+    Thread-safe counters and histograms, each identified by a metric name
+    and a tuple of (label, value) pairs.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.enabled = True
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        # Maps (name, labels) to a list of the counts of each bucket
+        # followed by the total count and the sum of the observed values.
+        self.histograms = {}
+
+    def inc(self, name, labels=(), amount=1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        self.lock.acquire()
+        try:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        finally:
+            self.lock.release()
+
+    def observe(self, name, labels, value):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        self.lock.acquire()
+        try:
+            try:
+                counts = self.histograms[key]
+            except KeyError:
+                counts = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += 1
+            counts[-1] += value
+        finally:
+            self.lock.release()
+
+    def value(self, name, labels=()):
+        """
+        Returns the value of a counter, or 0 if it hasn't been incremented.
+        """
+        return self.counters.get((name, labels), 0)
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.counters.clear()
+            self.histograms.clear()
+        finally:
+            self.lock.release()
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        self.lock.acquire()
+        try:
+            counters = self.counters.items()
+            histograms = [(key, list(counts)) for key, counts in self.histograms.items()]
+        finally:
+            self.lock.release()
+        # Maps metric names to lists of (labels, lines) tuples.
+        samples = {}
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(
+                (labels, ['%s%s %s' % (name, format_labels(labels), value)]))
+        for (name, labels), counts in histograms:
+            lines = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels, [('le', repr(bound))]), cumulative))
+            lines.append('%s_bucket%s %d' % (name, format_labels(labels, [('le', '+Inf')]), counts[-2]))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), counts[-2]))
+            lines.append('%s_sum%s %r' % (name, format_labels(labels), counts[-1]))
+            samples.setdefault(name, []).append((labels, lines))
+        output = []
+        names = samples.keys()
+        names.sort()
+        for name in names:
+            kind, description = DESCRIPTIONS.get(name, ('untyped', name))
+            output.append('# HELP %s %s' % (name, description))
+            output.append('# TYPE %s %s' % (name, kind))
+            series = samples[name]
+            series.sort()
+            for labels, lines in series:
+                output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+registry = Registry()
+
+
+def expose(request):
+    """
+    A view returning the metrics in the registry.
+    """
+    from django.http import HttpResponse
+    return HttpResponse(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware(object):
+    """
+    Counts 304 responses to feed views. Must come before
+    ConditionalGetMiddleware in MIDDLEWARE_CLASSES, so that it sees the
+    response after the conditional GET has been handled.
+    """
+    def process_response(self, request, response):
+        labels = getattr(request, 'syndication_labels', None)
+        if labels is not None and response.status_code == 304:
+            registry.inc('syndication_not_modified_total', labels)
+        return response
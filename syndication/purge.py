@@ -0,0 +1,162 @@
+"""
+Purging feeds from caching proxies and CDNs by surrogate key.
+
+Feeds with a ``surrogate_key_header`` (see syndication.views.Feed) list in
+that header a key for the feed, one for each model instance in it and one
+for each model its items are instances of, so a proxy that supports
+surrogate keys (Varnish with xkey, Fastly, ...) can cache them for a long
+time and drop exactly the feeds that include an object when it changes, or
+that may include a new one. A Purger sends those purges::
+
+    purger = Purger('http://varnish.internal/', header='xkey')
+    purger.connect(Entry, Category)
+"""
+import httplib
+import logging
+import socket
+import urllib
+import urlparse
+
+from django.utils.encoding import smart_str
+
+from syndication import records
+
+logger = logging.getLogger('syndication')
+
+
+def surrogate_key(obj):
+    """
+    Returns the surrogate key of a model instance, or None if obj isn't one.
+    """
+    key = records.object_key(obj)
+    if key is None:
+        return None
+    return '%s-%s' % (key[0], urllib.quote(smart_str(key[1]), ''))
+
+
+def model_surrogate_key(obj):
+    """
+    Returns the surrogate key of the model of obj, a model or model
+    instance: its table name. None if obj is neither.
+    """
+    meta = getattr(obj, '_meta', None)
+    if meta is None:
+        return None
+    return meta.db_table
+
+
+def feed_surrogate_key(feed):
+    """
+    Returns the surrogate key of every response of a feed instance.
+    """
+    return 'feed-%s.%s' % (feed.__class__.__module__, feed.__class__.__name__)
+
+
+class Purger(object):
+    """
+    Sends purge requests for surrogate keys to endpoint, an HTTP URL.
+
+    Each request uses method and lists up to max_keys keys, separated by
+    spaces, in header. Failures are logged rather than raised, so a proxy
+    that is down doesn't stop objects from being saved.
+    """
+    def __init__(self, endpoint, method='PURGE', header='Surrogate-Key', timeout=5,
+                 max_keys=256):
+        self.endpoint = endpoint
+        self.method = method
+        self.header = header
+        self.timeout = timeout
+        self.max_keys = max_keys
+
+    def keys_for(self, instance, created=False, deleted=False):
+        """
+        Returns the surrogate keys to purge when instance changes: its own,
+        carried by the feeds it is an item or the object of, followed by
+        membership_keys().
+        """
+        key = surrogate_key(instance)
+        if key is None:
+            return []
+        return [key] + self.membership_keys(instance, created, deleted)
+
+    def membership_keys(self, instance, created=False, deleted=False):
+        """
+        Returns the keys of the feeds instance may have joined or left, or
+        in which another instance may have taken its place. By default this
+        is the key of its model, carried by every feed that lists instances
+        of the model, since any save may publish, re-date or move an
+        instance. Override it to purge less, e.g. only the model's key when
+        created or deleted is True if saving an instance never changes which
+        feeds it is in.
+        """
+        return [model_surrogate_key(instance)]
+
+    def send(self, keys):
+        """
+        Sends one purge request for keys. Returns True if it succeeded.
+        """
+        url = urlparse.urlsplit(self.endpoint)
+        if url[0] == 'https':
+            connection_class = httplib.HTTPSConnection
+        else:
+            connection_class = httplib.HTTPConnection
+        path = url[2] or '/'
+        if url[3]:
+            path += '?' + url[3]
+        try:
+            connection = connection_class(url[1], timeout=self.timeout)
+            try:
+                connection.request(self.method, path, headers={self.header: ' '.join(keys)})
+                status = connection.getresponse().status
+            finally:
+                connection.close()
+        except (socket.error, httplib.HTTPException), e:
+            logger.warning('Purging %s from %s failed: %s', ' '.join(keys), self.endpoint, e)
+            return False
+        if status >= 400:
+            logger.warning('Purging %s from %s failed with status %d.',
+                           ' '.join(keys), self.endpoint, status)
+            return False
+        return True
+
+    def purge_keys(self, keys):
+        """
+        Purges keys, in batches of max_keys. Returns True if all the
+        requests succeeded.
+        """
+        keys = list(keys)
+        ok = True
+        for start in range(0, len(keys), self.max_keys):
+            if not self.send(keys[start:start + self.max_keys]):
+                ok = False
+        return ok
+
+    def purge(self, instance, created=False, deleted=False):
+        return self.purge_keys(self.keys_for(instance, created, deleted))
+
+    def purge_feed(self, feed):
+        """
+        Purges every response of a feed instance.
+        """
+        return self.purge_keys([feed_surrogate_key(feed)])
+
+    def connect(self, *models):
+        """
+        Purges instances of models whenever they are saved or deleted.
+        """
+        from django.db.models.signals import post_save, post_delete
+        for model in models:
+            post_save.connect(self.instance_saved, sender=model, weak=False)
+            post_delete.connect(self.instance_deleted, sender=model, weak=False)
+
+    def disconnect(self, *models):
+        from django.db.models.signals import post_save, post_delete
+        for model in models:
+            post_save.disconnect(self.instance_saved, sender=model)
+            post_delete.disconnect(self.instance_deleted, sender=model)
+
+    def instance_saved(self, sender, instance, created=False, **kwargs):
+        self.purge(instance, created=created)
+
+    def instance_deleted(self, sender, instance, **kwargs):
+        self.purge(instance, deleted=True)
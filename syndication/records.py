@@ -0,0 +1,136 @@
+"""
+A cache of resolved feed items shared between feeds.
+
+The same object often appears in several feeds (site-wide, per category, per
+author...). Feeds that set the same ``item_cache_namespace`` promise to
+resolve an item's title, link, description and so on in the same way, so the
+result of resolving it once is reused by all of them. Records are keyed by
+the model's table and the object's primary key, and are dropped whenever the
+object is saved or deleted.
+
+The cache lives in process memory, so it only sees saves and deletes made by
+the same process.
+"""
+import threading
+from collections import deque
+
+
+def object_key(obj):
+    """
+    Returns the key used for a model instance, or None if obj isn't one.
+    """
+    meta = getattr(obj, '_meta', None)
+    if meta is None:
+        return None
+    return (meta.db_table, obj.pk)
+
+
+class ItemCache(object):
+    """
+    A thread-safe store of resolved items, keyed by model instance, then by
+    namespace and site domain. Once more than max_size objects are cached,
+    the oldest are evicted first.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.records = {}
+        self.order = deque()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def key(self, obj):
+        return object_key(obj)
+
+    def get(self, namespace, domain, obj):
+        key = self.key(obj)
+        if key is None:
+            return None
+        self.lock.acquire()
+        try:
+            try:
+                record = self.records[key][(namespace, domain)]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return record
+        finally:
+            self.lock.release()
+
+    def set(self, namespace, domain, obj, record):
+        key = self.key(obj)
+        if key is None:
+            return
+        if not signals_connected:
+            connect_signals()
+        self.lock.acquire()
+        try:
+            if key not in self.records:
+                self.records[key] = {}
+                self.order.append(key)
+                while len(self.records) > self.max_size:
+                    self.records.pop(self.order.popleft(), None)
+                if len(self.order) > 2 * self.max_size:
+                    # Drop keys of objects that have since been invalidated.
+                    seen = {}
+                    for k in self.order:
+                        if k in self.records:
+                            seen[k] = True
+                    self.order = deque([k for k in self.order if seen.pop(k, False)])
+            self.records[key][(namespace, domain)] = record
+        finally:
+            self.lock.release()
+
+    def invalidate(self, obj):
+        key = self.key(obj)
+        self.lock.acquire()
+        try:
+            self.records.pop(key, None)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.records.clear()
+            self.order.clear()
+            self.hits = self.misses = 0
+        finally:
+            self.lock.release()
+
+item_cache = ItemCache()
+
+
+class HeaderCache(ItemCache):
+    """
+    An ItemCache for the channel headers of feeds, keyed by the feed's
+    object. Headers of feeds without an object are cached too.
+    """
+    def key(self, obj):
+        if obj is None:
+            return ('', None)
+        return object_key(obj)
+
+header_cache = HeaderCache(max_size=1000)
+
+
+def invalidate_item(sender, instance, **kwargs):
+    if item_cache.records:
+        item_cache.invalidate(instance)
+    if header_cache.records:
+        header_cache.invalidate(instance)
+
+signals_connected = False
+
+
+def connect_signals():
+    """
+    Connects invalidate_item() to the post_save and post_delete signals.
+    This is done when the first record is cached rather than on import, so
+    that importing this module doesn't need settings.
+    """
+    global signals_connected
+    from django.db.models.signals import post_save, post_delete
+    post_save.connect(invalidate_item, dispatch_uid='syndication.records.invalidate_item')
+    post_delete.connect(invalidate_item, dispatch_uid='syndication.records.invalidate_item')
+    signals_connected = True
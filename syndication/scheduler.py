@@ -0,0 +1,277 @@
+"""
+Regenerates feeds in the background, ahead of demand.
+
+Register syndication.views.Feed instances with a FeedScheduler and start it;
+each feed is regenerated on a pool of worker threads at an interval taken
+from its ttl (in minutes), or, for feeds without a ttl, adapted to how often
+its output actually changes. The generated feeds are put in the feed's
+``feed_cache`` so the view serves them without running get_feed(). When all
+workers are busy, the feeds that are requested most often are regenerated
+first.
+"""
+import logging
+import Queue
+import threading
+import time
+
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.hashcompat import md5_constructor
+
+from syndication import cache
+from syndication.warmup import warm_up_request
+
+logger = logging.getLogger('syndication')
+
+
+class TrackingStore(cache.MemoryStore):
+    """
+    A MemoryStore that counts how often each key is looked up.
+    """
+    def __init__(self, *args, **kwargs):
+        super(TrackingStore, self).__init__(*args, **kwargs)
+        self.lookups = {}
+
+    def get(self, key):
+        self.lookups[key] = self.lookups.get(key, 0) + 1
+        return super(TrackingStore, self).get(key)
+
+
+class ScheduledFeed(object):
+    """
+    A feed registered with a FeedScheduler, and statistics about it.
+    """
+    def __init__(self, feed, path, args, kwargs, host, interval):
+        self.feed = feed
+        self.path = path
+        self.args = args
+        self.kwargs = kwargs
+        self.host = host
+        self.fixed_interval = interval
+        self.interval = interval
+        self.key = feed.get_cache_key(self.request(), *args, **kwargs)
+        self.next_run = time.time()
+        self.running = False
+        self.runs = 0
+        self.errors = 0
+        self.last_duration = None
+        self.total_duration = 0.0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.digest = None
+
+    def request(self):
+        return warm_up_request(self.path, self.host)
+
+    def name(self):
+        return '%s.%s (%s)' % (self.feed.__class__.__module__,
+                               self.feed.__class__.__name__, self.path)
+
+
+class FeedScheduler(object):
+    """
+    Regenerates registered feeds on a pool of worker threads.
+
+    Feeds without a ttl or a fixed interval start at min_interval seconds;
+    the interval doubles every time the output is unchanged and halves every
+    time it changes, within min_interval and max_interval.
+    """
+    def __init__(self, workers=2, min_interval=60, max_interval=3600, store=None):
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        if store is None:
+            store = TrackingStore()
+        self.store = store
+        self.feeds = []
+        self.condition = threading.Condition()
+        self.queue = Queue.Queue()
+        self.idle = 0
+        self.threads = []
+        self.stopping = False
+
+    def register(self, feed, path, args=(), kwargs=None, host='localhost', interval=None):
+        """
+        Registers feed for regeneration, as if it were requested at path on
+        host with the given URL arguments. Unless the feed already has one,
+        the scheduler's store becomes its feed_cache.
+        """
+        if feed.feed_cache is None:
+            feed.feed_cache = self.store
+        scheduled = ScheduledFeed(feed, path, tuple(args), kwargs or {}, host, interval)
+        self.condition.acquire()
+        try:
+            self.feeds.append(scheduled)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        return scheduled
+
+    def popularity(self, scheduled):
+        lookups = getattr(scheduled.feed.feed_cache, 'lookups', None) or {}
+        return lookups.get(scheduled.key, 0)
+
+    def due(self, now=None):
+        """
+        Returns the feeds that are due for regeneration and not running, the
+        most requested first.
+        """
+        if now is None:
+            now = time.time()
+        due = [(-self.popularity(s), s.next_run, i, s)
+               for i, s in enumerate(self.feeds)
+               if not s.running and s.next_run <= now]
+        due.sort()
+        return [s for popularity, next_run, i, s in due]
+
+    def run(self, scheduled):
+        """
+        Regenerates a feed and reschedules it.
+        """
+        started = time.time()
+        scheduled.last_lag = max(started - scheduled.next_run, 0)
+        scheduled.max_lag = max(scheduled.max_lag, scheduled.last_lag)
+        feed = scheduled.feed
+        try:
+            try:
+                feedgen = feed.generate(scheduled.request(), *scheduled.args, **scheduled.kwargs)
+                response = HttpResponse(mimetype=feedgen.mime_type)
+                feedgen.write(response, 'utf-8')
+                body = response.content
+            finally:
+                connection.close()
+        except Exception:
+            logger.exception('Error regenerating feed %s.', scheduled.name())
+            scheduled.errors += 1
+            interval = scheduled.interval or self.min_interval
+        else:
+            interval = self.next_interval(scheduled, feedgen, body)
+            now = time.time()
+            # Keep serving the feed for a while after the next run is due, in
+            # case the scheduler falls behind.
+            feed.feed_cache.set(scheduled.key, cache.CachedFeed(body,
+                response['Content-Type'], created=now, expires=now + 2 * interval,
+                headers=feed.get_response_headers(feedgen)))
+        finished = time.time()
+        scheduled.runs += 1
+        scheduled.last_duration = finished - started
+        scheduled.total_duration += scheduled.last_duration
+        scheduled.interval = interval
+        scheduled.next_run = finished + interval
+
+    def next_interval(self, scheduled, feedgen, body):
+        if scheduled.fixed_interval is not None:
+            return scheduled.fixed_interval
+        ttl = feedgen.feed.get('ttl')
+        if ttl:
+            try:
+                return max(int(ttl) * 60, self.min_interval)
+            except ValueError:
+                pass
+        digest = md5_constructor(body).digest()
+        interval = scheduled.interval or self.min_interval
+        if scheduled.digest is not None:
+            if digest == scheduled.digest:
+                interval = min(interval * 2, self.max_interval)
+            else:
+                interval = max(interval / 2, self.min_interval)
+        scheduled.digest = digest
+        return interval
+
+    def run_pending(self):
+        """
+        Regenerates every feed that is due in the current thread. Useful
+        for running the scheduler from cron instead of as threads.
+        """
+        for scheduled in self.due():
+            self.run(scheduled)
+
+    def start(self):
+        """
+        Starts the dispatcher and worker threads.
+        """
+        self.stopping = False
+        for i in range(self.workers):
+            self.spawn(self.work, 'syndication-scheduler-worker-%d' % i)
+        self.spawn(self.dispatch, 'syndication-scheduler')
+
+    def stop(self):
+        """
+        Stops the threads, waiting for running regenerations to finish.
+        """
+        self.condition.acquire()
+        try:
+            self.stopping = True
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+        for i in range(self.workers):
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.setDaemon(True)
+        thread.start()
+        self.threads.append(thread)
+
+    def dispatch(self):
+        self.condition.acquire()
+        try:
+            while not self.stopping:
+                for scheduled in self.due()[:self.idle]:
+                    scheduled.running = True
+                    self.idle -= 1
+                    self.queue.put(scheduled)
+                next_runs = [s.next_run for s in self.feeds if not s.running]
+                timeout = 1.0
+                if next_runs and self.idle:
+                    timeout = min(max(min(next_runs) - time.time(), 0.01), timeout)
+                self.condition.wait(timeout)
+        finally:
+            self.condition.release()
+
+    def work(self):
+        while True:
+            self.condition.acquire()
+            try:
+                self.idle += 1
+                self.condition.notify()
+            finally:
+                self.condition.release()
+            scheduled = self.queue.get()
+            if scheduled is None:
+                return
+            try:
+                self.run(scheduled)
+            finally:
+                scheduled.running = False
+
+    def stats(self):
+        """
+        Returns a list of dictionaries with statistics for each feed:
+        interval and next run time, number of runs and errors, duration of
+        the last run and the average, lag of the last run behind its
+        scheduled time and the worst lag, and the number of requests.
+        """
+        stats = []
+        for s in self.feeds:
+            average = None
+            if s.runs:
+                average = s.total_duration / s.runs
+            stats.append({
+                'name': s.name(),
+                'key': s.key,
+                'interval': s.interval,
+                'next_run': s.next_run,
+                'runs': s.runs,
+                'errors': s.errors,
+                'last_duration': s.last_duration,
+                'average_duration': average,
+                'last_lag': s.last_lag,
+                'max_lag': s.max_lag,
+                'requests': self.popularity(s),
+            })
+        return stats
@@ -0,0 +1,230 @@
+"""
+A feed store shared by all the processes on a host through a memory-mapped
+file.
+
+Give every worker process a SharedMemoryStore on the same file (preferably
+on a memory-backed filesystem such as /dev/shm) as its ``feed_cache``, and a
+feed generated by one worker is served by all the others.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.hashcompat import sha_constructor
+
+from syndication import cache
+
+MAGIC = 'SYNDSHM1'
+# Magic, number of slots, slot size.
+FILE_HEADER = struct.Struct('<8sII')
+# Sequence number, key digest, created, expires, body length, content type
+# length. expires is -1 for bodies that are never fresh. The content type is
+# followed by the other headers, each on a line of its own.
+SLOT_HEADER = struct.Struct('<Q20sddIH')
+# The time a slot was last read, kept outside the part guarded by the
+# sequence number so readers can update it.
+LAST_USED = struct.Struct('<d')
+SEQUENCE = struct.Struct('<Q')
+SLOT_DATA = SLOT_HEADER.size + LAST_USED.size
+
+
+class SharedMemoryStore(object):
+    """
+    Stores feed bodies in fixed-size slots of a memory-mapped file at path.
+
+    Keys are hashed to a set of ``ways`` slots; a new body replaces the body
+    stored for the same key in the set, or an empty slot, or else the least
+    recently read one. Bodies that don't fit in a slot of slot_size bytes
+    (content type included) aren't stored.
+
+    Readers don't take any lock. Each slot has a sequence number that
+    writers make odd while they change the slot and even again afterwards;
+    a reader that sees it odd or changed while copying a body treats the
+    lookup as a miss. Writers lock the file with flock(), so writes from all
+    processes are serialized.
+    """
+    def __init__(self, path, slots=1024, slot_size=256 * 1024, ways=8):
+        if slots % ways:
+            raise ValueError('slots must be a multiple of ways.')
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ways = ways
+        self.size = FILE_HEADER.size + slots * (SLOT_DATA + slot_size)
+        self.lock = threading.Lock()
+        # flock() doesn't exclude threads sharing the file descriptor.
+        self.write_lock = threading.Lock()
+        self.pid = None
+        self.fd = None
+        self.map = None
+
+    def open(self):
+        """
+        Returns the memory map, opening and if needed initialising the file
+        first. The file is opened again in each process, since flock()
+        locks are shared by processes that inherit the same open file.
+        """
+        if self.pid == os.getpid():
+            return self.map
+        self.lock.acquire()
+        try:
+            if self.pid == os.getpid():
+                return self.map
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.read(fd, FILE_HEADER.size)
+                expected = FILE_HEADER.pack(MAGIC, self.slots, self.slot_size)
+                if not header.startswith(MAGIC):
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.write(fd, expected)
+                elif header != expected or os.fstat(fd).st_size != self.size:
+                    # Resizing the file could crash processes that have it
+                    # mapped.
+                    raise ImproperlyConfigured('%s was created with a different number '
+                        'or size of slots; remove it first.' % self.path)
+            except:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+                raise
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self.map = mmap.mmap(fd, self.size)
+            self.fd = fd
+            self.pid = os.getpid()
+            return self.map
+        finally:
+            self.lock.release()
+
+    def lock_for_writing(self):
+        self.write_lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except:
+            self.write_lock.release()
+            raise
+
+    def unlock(self):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.write_lock.release()
+
+    def digest(self, key):
+        return sha_constructor(key).digest()
+
+    def offsets(self, digest):
+        """
+        Returns the offsets of the slots a key with digest can be stored in.
+        """
+        first = (struct.unpack('<I', digest[:4])[0] % (self.slots / self.ways)) * self.ways
+        return [FILE_HEADER.size + (first + i) * (SLOT_DATA + self.slot_size)
+                for i in range(self.ways)]
+
+    def get(self, key):
+        m = self.open()
+        digest = self.digest(key)
+        for offset in self.offsets(digest):
+            sequence, slot_digest, created, expires, length, type_length = \
+                SLOT_HEADER.unpack_from(m, offset)
+            if slot_digest != digest:
+                continue
+            if sequence % 2:
+                return None
+            start = offset + SLOT_DATA
+            meta = m[start:start + type_length]
+            body = m[start + type_length:start + type_length + length]
+            if SEQUENCE.unpack_from(m, offset)[0] != sequence:
+                # The slot was rewritten while it was being read.
+                return None
+            LAST_USED.pack_into(m, offset + SLOT_HEADER.size, time.time())
+            if expires < 0:
+                expires = None
+            lines = meta.split('\n')
+            headers = [tuple(line.split(': ', 1)) for line in lines[1:]]
+            return cache.CachedFeed(body, lines[0], created=created, expires=expires,
+                                    headers=headers)
+        return None
+
+    def set(self, key, entry):
+        body = entry.body
+        content_type = '\n'.join([entry.content_type] +
+                                 ['%s: %s' % header for header in entry.headers])
+        if len(body) + len(content_type) > self.slot_size or len(content_type) > 0xffff:
+            return
+        m = self.open()
+        digest = self.digest(key)
+        expires = entry.expires
+        if expires is None:
+            expires = -1.0
+        self.lock_for_writing()
+        try:
+            offset = self.choose(m, digest)
+            sequence = SEQUENCE.unpack_from(m, offset)[0]
+            SEQUENCE.pack_into(m, offset, sequence + 1)
+            start = offset + SLOT_DATA
+            m[start:start + len(content_type) + len(body)] = content_type + body
+            SLOT_HEADER.pack_into(m, offset, sequence + 1, digest, entry.created,
+                                  expires, len(body), len(content_type))
+            LAST_USED.pack_into(m, offset + SLOT_HEADER.size, time.time())
+            SEQUENCE.pack_into(m, offset, sequence + 2)
+        finally:
+            self.unlock()
+
+    def choose(self, m, digest):
+        """
+        Returns the offset of the slot to store a body for digest in.
+        """
+        empty = oldest = None
+        for offset in self.offsets(digest):
+            slot_digest = SLOT_HEADER.unpack_from(m, offset)[1]
+            if slot_digest == digest:
+                return offset
+            if empty is None and slot_digest == '\0' * 20:
+                empty = offset
+            last_used = LAST_USED.unpack_from(m, offset + SLOT_HEADER.size)[0]
+            if oldest is None or last_used < oldest[0]:
+                oldest = (last_used, offset)
+        if empty is not None:
+            return empty
+        return oldest[1]
+
+    def delete(self, key):
+        m = self.open()
+        digest = self.digest(key)
+        self.lock_for_writing()
+        try:
+            for offset in self.offsets(digest):
+                sequence, slot_digest = SLOT_HEADER.unpack_from(m, offset)[:2]
+                if slot_digest == digest:
+                    SLOT_HEADER.pack_into(m, offset, sequence + 2, '\0' * 20, 0, 0, 0, 0)
+                    LAST_USED.pack_into(m, offset + SLOT_HEADER.size, 0)
+        finally:
+            self.unlock()
+
+    def clear(self):
+        m = self.open()
+        self.lock_for_writing()
+        try:
+            for i in range(self.slots):
+                offset = FILE_HEADER.size + i * (SLOT_DATA + self.slot_size)
+                sequence = SEQUENCE.unpack_from(m, offset)[0]
+                SLOT_HEADER.pack_into(m, offset, sequence + 2, '\0' * 20, 0, 0, 0, 0)
+                LAST_USED.pack_into(m, offset + SLOT_HEADER.size, 0)
+        finally:
+            self.unlock()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            if self.map is not None and self.pid == os.getpid():
+                self.map.close()
+                os.close(self.fd)
+            self.map = self.fd = self.pid = None
+        finally:
+            self.lock.release()
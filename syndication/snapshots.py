@@ -0,0 +1,254 @@
+"""
+A feed store that keeps generated feeds as files in a local directory.
+
+Snapshots survive restarts, so a freshly started worker serves the feeds
+generated before it started instead of rendering them all again, and they
+are served straight from disk, either with a FileWrapper or by handing the
+file to the front-end server with an X-Sendfile style header.
+"""
+import errno
+import fcntl
+import os
+import tempfile
+
+from django.core.servers.basehttp import FileWrapper
+from django.http import HttpResponse
+from django.utils.hashcompat import md5_constructor
+
+from syndication import cache
+
+
+class FileResponse(HttpResponse):
+    """
+    A response whose content is a FileWrapper. Reading its content, as
+    middleware that computes ETags or compresses responses does, reads the
+    whole file into memory so it can still be sent afterwards.
+    """
+    def _get_content(self):
+        if not self._is_string:
+            wrapper = self._container
+            try:
+                self._container = [''.join(wrapper)]
+            finally:
+                wrapper.close()
+            self._is_string = True
+        return HttpResponse._get_content(self)
+
+    content = property(_get_content, HttpResponse._set_content)
+
+
+class Snapshot(cache.CachedFeed):
+    """
+    A feed body stored in a file by a SnapshotStore.
+    """
+    def __init__(self, store, key, path, content_type, created, expires, headers=()):
+        self.store = store
+        self.key = key
+        self.path = path
+        self.content_type = content_type
+        self.created = created
+        self.expires = expires
+        self.headers = list(headers)
+
+    def body(self):
+        f = open(self.path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+    body = property(body)
+
+    def response(self):
+        store = self.store
+        if store.sendfile_header is not None:
+            location = self.path
+            if store.sendfile_prefix is not None:
+                location = store.sendfile_prefix + os.path.basename(self.path)
+            response = HttpResponse('', content_type=self.content_type)
+            response[store.sendfile_header] = location
+        else:
+            try:
+                f = open(self.path, 'rb')
+            except IOError:
+                # The snapshot was replaced twice since it was looked up, or
+                # its body was removed. Feed views regenerate the feed if
+                # there is no newer snapshot either.
+                current = store.get(self.key)
+                if current is None or current.path == self.path:
+                    raise
+                return current.response()
+            response = FileResponse(FileWrapper(f, store.block_size), content_type=self.content_type)
+            response['Content-Length'] = str(os.fstat(f.fileno()).st_size)
+        for name, value in self.headers:
+            response[name] = value
+        return response
+
+
+class SnapshotStore(object):
+    """
+    Stores feed bodies as files in directory.
+
+    Each key has an index file naming the current body file along with its
+    content type, creation and expiry times and other headers, including an
+    ETag computed from the body, so that CommonMiddleware doesn't read the
+    body to compute one. Body files are named after their content and
+    written to a temporary file first; the index file is then replaced with
+    rename(), so readers never see a partial snapshot. The body that was
+    current before is named in the index too, and kept until the next
+    replacement, in case it is still being sent. Writers of the same key, in any process,
+    take turns through a flock() on a lock file, so one never removes the
+    body another has just made current.
+
+    If sendfile_header is set (e.g. 'X-Sendfile' for Apache or lighttpd, or
+    'X-Accel-Redirect' for nginx), responses have no body but that header,
+    set to the path of the body file, or to sendfile_prefix followed by the
+    name of the body file if sendfile_prefix is set.
+    """
+    def __init__(self, directory, sendfile_header=None, sendfile_prefix=None,
+                 block_size=65536):
+        self.directory = directory
+        self.sendfile_header = sendfile_header
+        self.sendfile_prefix = sendfile_prefix
+        self.block_size = block_size
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def name(self, key):
+        return md5_constructor(key).hexdigest()
+
+    def index_path(self, key):
+        return os.path.join(self.directory, self.name(key) + '.index')
+
+    def lock_path(self, key):
+        return os.path.join(self.directory, self.name(key) + '.lock')
+
+    def lock(self, key):
+        """
+        Locks key for writing and returns the file descriptor to pass to
+        unlock().
+        """
+        fd = os.open(self.lock_path(key), os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except:
+            os.close(fd)
+            raise
+        return fd
+
+    def unlock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def read_index(self, index_path):
+        f = open(index_path, 'rb')
+        try:
+            lines = f.read().split('\n')
+        finally:
+            f.close()
+        key, bodies, content_type, created, expires = lines[:5]
+        # The current body, followed by the previous one if it is kept.
+        bodies = bodies.split(' ')
+        body_name = bodies[0]
+        previous = None
+        if len(bodies) > 1:
+            previous = bodies[1]
+        if expires == 'None':
+            expires = None
+        else:
+            expires = float(expires)
+        headers = [tuple(line.split(': ', 1)) for line in lines[5:]]
+        return key, body_name, previous, content_type, float(created), expires, headers
+
+    def get(self, key):
+        try:
+            stored_key, body_name, previous, content_type, created, expires, headers = \
+                self.read_index(self.index_path(key))
+        except (IOError, ValueError):
+            return None
+        if stored_key != key:
+            return None
+        return Snapshot(self, key, os.path.join(self.directory, body_name),
+                        content_type, created, expires, headers)
+
+    def set(self, key, entry):
+        name = self.name(key)
+        body = entry.body
+        digest = md5_constructor(body).hexdigest()
+        body_name = '%s.%s.body' % (name, digest[:12])
+        headers = list(entry.headers)
+        if 'etag' not in [header[0].lower() for header in headers]:
+            # The ETag CommonMiddleware would give the body.
+            headers.append(('ETag', '"%s"' % digest))
+        body_path = os.path.join(self.directory, body_name)
+        fd = self.lock(key)
+        try:
+            current = previous = None
+            try:
+                current, previous = self.read_index(self.index_path(key))[1:3]
+            except (IOError, ValueError):
+                pass
+            if not os.path.exists(body_path):
+                self.write(body_path, body)
+            bodies = body_name
+            if current is not None and current != body_name:
+                # Keep the body that was current until now, in case it is
+                # still being sent.
+                bodies = '%s %s' % (body_name, current)
+            elif previous is not None:
+                bodies = '%s %s' % (body_name, previous)
+            self.write(self.index_path(key), '\n'.join([
+                key, bodies, entry.content_type, repr(entry.created), repr(entry.expires)] +
+                ['%s: %s' % header for header in headers]))
+            # Remove the body that is no longer kept.
+            if (current != body_name and previous is not None
+                    and previous not in (body_name, current)):
+                self.remove(os.path.join(self.directory, previous))
+        finally:
+            self.unlock(fd)
+
+    def write(self, path, data):
+        """
+        Atomically replaces the file at path with data.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.chmod(temp_path, 0644)
+            os.rename(temp_path, path)
+        except:
+            self.remove(temp_path)
+            raise
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def delete(self, key):
+        name = self.name(key)
+        fd = self.lock(key)
+        try:
+            self.remove(self.index_path(key))
+            for filename in os.listdir(self.directory):
+                if filename.startswith(name + '.') and filename.endswith('.body'):
+                    self.remove(os.path.join(self.directory, filename))
+        finally:
+            self.unlock(fd)
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if (filename.endswith('.index') or filename.endswith('.body')
+                    or filename.endswith('.lock')):
+                self.remove(os.path.join(self.directory, filename))
@@ -1,6 +1,10 @@
+import datetime
+import threading
+import time
+
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import tzinfo
-from syndication import feedgenerator, feeds, views
+from syndication import aggregate, cache, feedgenerator, feeds, locks, materialized, views
 from syndication.tests.models import Article, Entry
 
 
@@ -39,10 +43,281 @@ class TestRss2Feed(views.Feed):
     item_copyright = 'Copyright (c) 2007, Sally Smith'
 
 
+class TestLinkPatternFeed(TestRss2Feed):
+    item_link_pattern = ('test-entry', {'pk': 'pk'})
+    trusted_input = True
+
+
+class TestAdaptiveTtlFeed(TestRss2Feed):
+    adaptive_ttl = True
+    max_ttl = 120
+
+
+class TestSnapshotFeed(TestRss2Feed):
+    # The tests set feed_cache to a SnapshotStore.
+    cache_timeout = 60
+
+
+class TestSurrogateKeyFeed(TestRss2Feed):
+    surrogate_key_header = 'Surrogate-Key'
+
+
+class TestTrustedRss2Feed(TestRss2Feed):
+    trusted_input = True
+    feed_url = '/rss2/'
+
+
+class TestMaxItemsFeed(TestRss2Feed):
+    max_items = 2
+
+
+class TestItemCacheFeed(TestRss2Feed):
+    item_cache_namespace = 'entries'
+
+
+class TestItemCacheAtomFeed(TestItemCacheFeed):
+    feed_type = feedgenerator.Atom1Feed
+
+
+class SlowFeed(views.Feed):
+    """
+    A feed that counts how many times it was generated, and can be made to
+    wait while generating.
+    """
+    title = 'Slow feed'
+    link = '/slow/'
+    description = 'A feed that takes a while to generate.'
+    
+    def __init__(self, **kwargs):
+        # If set, generation waits until the event is set.
+        self.gate = None
+        self.generated = 0
+        self.lock = threading.Lock()
+        self.feed_cache = cache.MemoryStore()
+        self.regeneration_lock = locks.ThreadLocks()
+        self.__dict__.update(kwargs)
+    
+    def items(self):
+        self.lock.acquire()
+        try:
+            self.generated += 1
+            generated = self.generated
+        finally:
+            self.lock.release()
+        if self.gate is not None:
+            self.gate.wait()
+        return ['Generation %d' % generated]
+    
+    def item_link(self, item):
+        return '/slow/'
+
+
+class StateFeed(views.Feed):
+    """
+    A feed that keeps everything it works out for a request on the
+    FeedState, yielding between resolvers so that concurrent requests
+    interleave.
+    """
+    description = 'A feed for each name.'
+    
+    def get_object(self, request, name, state):
+        state.name = name
+        return name.upper()
+    
+    def title(self, obj, state):
+        time.sleep(0)
+        return '%s feed for %s' % (obj, state.name)
+    
+    def link(self, obj, state):
+        return '/state/%s/' % state.name
+    
+    def items(self, obj, state):
+        state.items = ['%s-%d' % (state.name, i) for i in range(5)]
+        return state.items
+    
+    def item_title(self, item, state):
+        time.sleep(0)
+        return '%s of %s' % (item, state.obj)
+    
+    def item_description(self, item, state):
+        time.sleep(0)
+        return '%d of %d' % (state.items.index(item) + 1, len(state.items))
+    
+    def item_link(self, item):
+        return '/state/%s/' % item
+    
+    def item_pubdate(self, item):
+        return datetime.datetime(2010, 1, 1)
+
+
+class TestMaterializedFeed(materialized.MaterializedFeed):
+    """
+    A materialized feed of entries that counts how many items it resolved.
+    """
+    title = 'My blog'
+    description = 'A more thorough description of my blog.'
+    link = '/blog/'
+    tracked_models = (Entry,)
+    materialized_path = '/materialized/'
+    materialized_host = 'testserver'
+    ring_size = 3
+    # If set, resolving an item raises this exception.
+    error = None
+    
+    def __init__(self):
+        self.fragment_store = cache.MemoryStore()
+        self.resolved = 0
+        super(TestMaterializedFeed, self).__init__()
+    
+    def items(self):
+        return Entry.objects.exclude(title__startswith='Draft').order_by('-date')
+    
+    def item_in_feed(self, obj, item):
+        return not item.title.startswith('Draft')
+    
+    def item_description(self, item):
+        if self.error is not None:
+            raise self.error
+        self.resolved += 1
+        return 'Description of %s' % item
+    
+    def item_pubdate(self, item):
+        return item.date
+
+
+class PlanetSourceFeed(views.Feed):
+    """
+    A source of an aggregated feed. Items are (guid, hour) tuples, ordered
+    newest first, and the feed counts how many have been fetched.
+    """
+    link = '/planet/'
+    
+    def __init__(self, name, entries):
+        self.name = name
+        self.entries = entries
+        self.fetched = 0
+    
+    def items(self):
+        for entry in self.entries:
+            self.fetched += 1
+            yield entry
+    
+    def item_title(self, item):
+        return '%s: %s' % (self.name, item[0])
+    
+    def item_link(self, item):
+        return '/planet/%s/' % item[0]
+    
+    def item_pubdate(self, item):
+        return datetime.datetime(2010, 1, 1, item[1], tzinfo=tzinfo.FixedOffset(0))
+
+
+class PlanetFeed(aggregate.AggregateFeed):
+    title = 'Planet'
+    link = '/planet/'
+    description = 'The newest items from all our feeds.'
+    max_items = 4
+
+
+class TestCachedHeaderFeed(TestRss2Feed):
+    cache_header = True
+
+
+class TestCachedHeaderAtomFeed(TestCachedHeaderFeed):
+    feed_type = feedgenerator.Atom1Feed
+    subtitle = TestRss2Feed.description
+
+
+class TestEntryHeaderFeed(TestCachedHeaderFeed):
+    """
+    A feed with a channel header that depends on its object.
+    """
+    def get_object(self, request, pk):
+        return Entry.objects.get(pk=pk)
+    
+    def title(self, obj):
+        return obj.title
+
+
+class TestLiteFeed(TestRss2Feed):
+    """
+    A feed served as its lite variant, which mustn't resolve the omitted
+    attributes.
+    """
+    lite_description_words = 2
+    
+    def item_author_name(self, item):
+        raise AssertionError('item_author_name() was called.')
+    
+    def item_categories(self, item):
+        raise AssertionError('item_categories() was called.')
+    
+    def item_copyright(self, item):
+        raise AssertionError('item_copyright() was called.')
+
+
+class TestBulkFeed(TestRss2Feed):
+    """
+    A feed of the entries up to an entry, which counts queries and resolved
+    items.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.resolved = 0
+    
+    def get_object(self, request, pk):
+        return Entry.objects.get(pk=pk)
+    
+    def get_feed_path(self, obj):
+        return '/bulk/%d/' % obj.pk
+    
+    def items(self, obj):
+        self.queries += 1
+        return Entry.objects.filter(date__lte=obj.date)
+    
+    def items_for_objects(self, objs, limit=None):
+        self.queries += 1
+        entries = list(Entry.objects.all())
+        return dict([(obj, [e for e in entries if e.date <= obj.date][:limit]) for obj in objs])
+    
+    def item_title(self, item):
+        self.resolved += 1
+        return item.title
+
+
+class TestBulkStateFeed(TestBulkFeed):
+    """
+    A bulk feed whose item titles depend on the feed object.
+    """
+    def item_title(self, item, state):
+        self.resolved += 1
+        return u'%s in %s' % (item.title, state.obj.title)
+
+
 class TestRss091Feed(TestRss2Feed):
     feed_type = feedgenerator.RssUserland091Feed
 
 
+class TestRss091ElisionFeed(TestRss091Feed):
+    """
+    An RSS 0.91 feed which mustn't resolve what RSS 0.91 doesn't write.
+    """
+    def author_name(self):
+        raise AssertionError('author_name() was called.')
+    
+    def item_guid(self, item):
+        raise AssertionError('item_guid() was called.')
+    
+    def item_author_name(self, item):
+        raise AssertionError('item_author_name() was called.')
+    
+    def item_categories(self, item):
+        raise AssertionError('item_categories() was called.')
+    
+    def item_copyright(self, item):
+        raise AssertionError('item_copyright() was called.')
+
+
 class TestAtomFeed(TestRss2Feed):
     feed_type = feedgenerator.Atom1Feed
     subtitle = TestRss2Feed.description
@@ -61,6 +336,14 @@ class TestEnclosureFeed(TestRss2Feed):
     pass
 
 
+class TestEnclosurePathFeed(TestRss2Feed):
+    """
+    A feed with enclosures for local media files; set enclosure_resolver.
+    """
+    def item_enclosure_path(self, item):
+        return 'entry %s.mp3' % item.pk
+
+
 class TemplateFeed(TestRss2Feed):
     """
     A feed to test defining item titles and descriptions with templates.
@@ -96,6 +379,10 @@ class TestFeedUrlFeed(TestAtomFeed):
     feed_url = 'http://example.com/customfeedurl/'
 
 
+class TestMaxBytesFeed(TestAtomFeed):
+    max_bytes = 1200
+
+
 class MyCustomAtom1Feed(feedgenerator.Atom1Feed):
     """
     Test of a custom feed generator class.
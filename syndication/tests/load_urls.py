@@ -0,0 +1,72 @@
+"""
+URLconf used by syndication.loadtest: the test feeds plus synthetic feeds of
+arbitrary size that don't touch the database.
+"""
+import datetime
+
+from django.conf.urls.defaults import *
+
+from syndication import feedgenerator, views
+
+
+class SyntheticItem(object):
+    def __init__(self, pk, date, description_size):
+        self.pk = pk
+        self.title = u'Synthetic entry %d' % pk
+        self.date = date
+        self.description = (u'<p>Entry %d &amp; friends.</p>' % pk) * description_size
+
+    def __unicode__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return '/synthetic/%d/' % self.pk
+
+
+class LargeFeed(views.Feed):
+    title = 'Synthetic feed'
+    link = '/synthetic/'
+    description = 'A large feed generated without the database.'
+    categories = ('load', 'test')
+    ttl = 60
+
+    def get_object(self, request, count, size=1):
+        return (int(count), int(size))
+
+    def items(self, obj):
+        count, size = obj
+        start = datetime.datetime(2010, 1, 1)
+        return [SyntheticItem(i, start + datetime.timedelta(hours=i), size)
+                for i in xrange(count, 0, -1)]
+
+    def item_description(self, item):
+        return item.description
+
+    def item_pubdate(self, item):
+        return item.date
+
+    item_author_name = 'Load Tester'
+    item_categories = ('synthetic',)
+
+
+class LargeAtomFeed(LargeFeed):
+    feed_type = feedgenerator.Atom1Feed
+
+
+class LargeCDataFeed(LargeFeed):
+    cdata_threshold = 1024
+
+
+class LargeCDataAtomFeed(LargeAtomFeed):
+    cdata_threshold = 1024
+
+
+urlpatterns = patterns('',
+    (r'^large/(?P<count>\d+)/$', LargeFeed()),
+    (r'^large/(?P<count>\d+)/(?P<size>\d+)/$', LargeFeed()),
+    (r'^large-atom/(?P<count>\d+)/$', LargeAtomFeed()),
+    (r'^large-atom/(?P<count>\d+)/(?P<size>\d+)/$', LargeAtomFeed()),
+    (r'^large-cdata/(?P<count>\d+)/(?P<size>\d+)/$', LargeCDataFeed()),
+    (r'^large-cdata-atom/(?P<count>\d+)/(?P<size>\d+)/$', LargeCDataAtomFeed()),
+    (r'', include('syndication.tests.urls')),
+)
@@ -1,9 +1,25 @@
+import BaseHTTPServer
 import datetime
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest, QueryDict
 from django.test import TestCase
+from django.test.client import Client
 from django.utils.feedgenerator import Atom1Feed
 from django.utils import tzinfo
-from syndication import feedgenerator, feeds, views
+from django.utils.hashcompat import md5_constructor
+from syndication import aggregate, cache, enclosures, feedgenerator, feeds, loadtest, locks, materialized, metrics, purge, records, scheduler, sharedcache, snapshots, views, warmup
+from syndication.tests.feeds import DepreciatedRssFeed, TestAdaptiveTtlFeed, TestSnapshotFeed, TestSurrogateKeyFeed, PlanetFeed, PlanetSourceFeed, SlowFeed, StateFeed, TestBulkFeed, TestBulkStateFeed, TestEnclosurePathFeed, TestMaterializedFeed
+from syndication.tests import urls
 from syndication.tests.models import Entry
 from xml.dom import minidom
 
@@ -107,6 +123,121 @@ class SyndicationFeedTest(FeedTestCase):
         for item in items:
             self.assertChildNodes(item, ['title', 'link', 'description', 'guid', 'category', 'pubDate', 'author'])
     
+    def test_trusted_input(self):
+        """
+        Test that a feed with trusted input produces the same output.
+        """
+        response = self.client.get('/rss2/')
+        trusted_response = self.client.get('/rss2-trusted/')
+        self.assertEqual(trusted_response.content, response.content)
+    
+    def test_lite_variant(self):
+        """
+        Test the lite variant of a feed.
+        """
+        response = self.client.get('/lite/')
+        doc = minidom.parseString(response.content)
+        items = doc.getElementsByTagName('item')
+        self.assertEqual(len(items), Entry.objects.count())
+        for item in items:
+            self.assertChildNodes(item, ['title', 'link', 'description', 'guid', 'pubDate'])
+        description = items[0].getElementsByTagName('description')[0].firstChild.wholeText
+        self.assertEqual(description, u'Overridden description ...')
+    
+    def test_max_items(self):
+        """
+        Test that feeds are truncated to max_items.
+        """
+        response = self.client.get('/max-items/')
+        doc = minidom.parseString(response.content)
+        self.assertEqual(len(doc.getElementsByTagName('item')), 2)
+    
+    def test_global_max_items(self):
+        """
+        Test that the SYNDICATION_MAX_ITEMS setting limits all feeds.
+        """
+        old_max_items = getattr(settings, 'SYNDICATION_MAX_ITEMS', None)
+        settings.SYNDICATION_MAX_ITEMS = 1
+        try:
+            response = self.client.get('/rss2/')
+        finally:
+            settings.SYNDICATION_MAX_ITEMS = old_max_items
+        doc = minidom.parseString(response.content)
+        self.assertEqual(len(doc.getElementsByTagName('item')), 1)
+    
+    def test_max_bytes(self):
+        """
+        Test that output stops at an item boundary once max_bytes have been
+        written, leaving a well-formed document.
+        """
+        response = self.client.get('/max-bytes/')
+        feed = minidom.parseString(response.content).firstChild
+        self.assertEqual(feed.nodeName, 'feed')
+        entries = feed.getElementsByTagName('entry')
+        self.assertTrue(0 < len(entries) < Entry.objects.count())
+    
+    def test_adaptive_ttl(self):
+        response = self.client.get('/adaptive-ttl/')
+        self.assertEqual(response['Cache-Control'], 'max-age=7200')
+        self.failUnless(response['Expires'].endswith(' GMT'))
+        chan = minidom.parseString(response.content).getElementsByTagName('channel')[0]
+        self.assertEqual(chan.getElementsByTagName('ttl')[0].firstChild.wholeText, '120')
+        
+        feed = views.Feed()
+        start = datetime.datetime(2010, 1, 1, 12, 0)
+        now = time.mktime((start + datetime.timedelta(hours=3)).timetuple())
+        hourly = [start + datetime.timedelta(hours=i) for i in range(3)]
+        self.assertEqual(views.median_interval(hourly, now), 3600)
+        self.assertEqual(feed.get_adaptive_ttl(hourly, now), 60)
+        self.assertEqual(feed.get_adaptive_ttl(hourly[:1], now), 180)
+        self.assertEqual(feed.get_adaptive_ttl([], now), feed.max_ttl)
+        feed.min_ttl = 90
+        self.assertEqual(feed.get_adaptive_ttl(hourly, now), 90)
+        
+        # Stored feeds are kept for the ttl, and served with what is left.
+        feed = TestAdaptiveTtlFeed()
+        feed.feed_cache = cache.MemoryStore()
+        self.assertEqual(feed(make_request('/adaptive-ttl/'))['Cache-Control'], 'max-age=7200')
+        entry = feed.feed_cache.entries.values()[0]
+        self.assertAlmostEqual(entry.expires - entry.created, 7200, 0)
+        entry.expires -= 1800
+        self.assertEqual(feed(make_request('/adaptive-ttl/'))['Cache-Control'], 'max-age=5400')
+        
+        # The ttl isn't part of a cached header.
+        feed = TestAdaptiveTtlFeed()
+        feed.cache_header = True
+        feed.ttl = 600
+        for i in range(2):
+            response = feed(make_request('/adaptive-ttl/header/'))
+            self.assertEqual(response['Cache-Control'], 'max-age=7200')
+            chan = minidom.parseString(response.content).getElementsByTagName('channel')[0]
+            self.assertEqual(chan.getElementsByTagName('ttl')[0].firstChild.wholeText, '120')
+    
+    def test_item_link_pattern(self):
+        """
+        Test that links built from item_link_pattern match item_link().
+        """
+        def links(path):
+            doc = minidom.parseString(self.client.get(path).content)
+            return [(item.getElementsByTagName('link')[0].firstChild.wholeText,
+                     item.getElementsByTagName('guid')[0].firstChild.wholeText)
+                    for item in doc.getElementsByTagName('item')]
+        expected = links('/rss2/')
+        self.assertEqual(links('/link-pattern/'), expected)
+        self.assertEqual(expected[0][0], 'http://testserver/blog/1/')
+        
+        feed = views.Feed()
+        feed.item_link_pattern = ('test-entry', {'pk': 'title'})
+        entry = Entry(pk=1, title=u'caf\xe9 au lait')
+        self.assertEqual(feed.pattern_link(entry, 'example.com'),
+                         'http://example.com/blog/caf%C3%A9%20au%20lait/')
+        self.assertEqual(feed.get_item_guid(entry), '/blog/caf%C3%A9%20au%20lait/')
+        # Characters reverse() leaves alone are left alone.
+        entry.title = u'a+b:c~d@(e)'
+        self.assertEqual(feed.pattern_link(entry), '/blog/a+b:c~d@(e)/')
+        feed.item_link_pattern = ('no-such-url', {'pk': 'pk'})
+        self.assertRaises(ImproperlyConfigured, feed.pattern_link, entry)
+    
     def test_rss091_feed(self):
         """
         Test the structure and content of feeds generated by RssUserland091Feed.
@@ -152,6 +283,41 @@ class SyndicationFeedTest(FeedTestCase):
             self.assertChildNodes(item, ['title', 'link', 'description'])
             self.assertCategories(item, [])
     
+    def test_field_elision(self):
+        """
+        Test that attributes the feed type doesn't write aren't resolved.
+        """
+        response = self.client.get('/rss091-elision/')
+        self.assertEqual(response.content.replace('/rss091-elision/', '/rss091/'),
+                         self.client.get('/rss091/').content)
+        
+        feed = views.Feed()
+        feed.feed_type = feedgenerator.Atom1Feed
+        self.assertEqual(feed.omitted_item_fields(), ())
+        feed.feed_type = feedgenerator.Rss201rev2Feed
+        self.assertEqual(feed.omitted_item_fields(), ('author_link', 'item_copyright'))
+        # Generators can declare more fields.
+        class CopyrightRss2Feed(feedgenerator.Rss201rev2Feed):
+            item_fields = feedgenerator.Rss201rev2Feed.item_fields | frozenset(['item_copyright'])
+        feed.feed_type = CopyrightRss2Feed
+        self.assertEqual(feed.omitted_item_fields(), ('author_link',))
+        # Subclasses that write items differently without declaring their
+        # fields get everything, those that don't keep their base's fields.
+        class UndeclaredRss2Feed(feedgenerator.Rss201rev2Feed):
+            def add_item_elements(self, handler, item):
+                super(UndeclaredRss2Feed, self).add_item_elements(handler, item)
+                if item['item_copyright'] is not None:
+                    handler.addQuickElement(u'copyright', item['item_copyright'])
+        feed.feed_type = UndeclaredRss2Feed
+        self.assertEqual(feed.omitted_item_fields(), ())
+        class PlainRss2Feed(feedgenerator.Rss201rev2Feed):
+            mime_type = 'application/xml'
+        feed.feed_type = PlainRss2Feed
+        self.assertEqual(feed.omitted_item_fields(), ('author_link', 'item_copyright'))
+        # Generators that don't declare their fields get everything.
+        feed.feed_type = Atom1Feed
+        self.assertEqual(feed.omitted_item_fields(), ())
+    
     def test_atom_feed(self):
         """
         Test the structure and content of feeds generated by Atom1Feed.
@@ -283,6 +449,972 @@ class SyndicationFeedTest(FeedTestCase):
         )
 
 
+######################################
+# Item cache
+######################################
+
+class ItemCacheTest(FeedTestCase):
+    """
+    Tests for sharing resolved items between feeds.
+    """
+    
+    def setUp(self):
+        records.item_cache.clear()
+    
+    def tearDown(self):
+        records.item_cache.clear()
+    
+    def test_shared_items(self):
+        """
+        Test that feeds in the same namespace share resolved items.
+        """
+        response = self.client.get('/item-cache/rss2/')
+        self.assertEqual(records.item_cache.misses, Entry.objects.count())
+        self.assertEqual(records.item_cache.hits, 0)
+        self.client.get('/item-cache/atom/')
+        self.assertEqual(records.item_cache.hits, Entry.objects.count())
+        # Feeds in other namespaces are unaffected.
+        self.client.get('/rss2/')
+        self.assertEqual(records.item_cache.hits, Entry.objects.count())
+        
+        content = response.content.replace('/item-cache/rss2/', '/rss2/')
+        self.assertEqual(content, self.client.get('/rss2/').content)
+        self.assertEqual(self.client.get('/item-cache/rss2/').content, response.content)
+    
+    def test_invalidation(self):
+        """
+        Test that saving or deleting an object drops its cached item.
+        """
+        self.client.get('/item-cache/rss2/')
+        entry = Entry.objects.get(pk=1)
+        entry.title = 'Changed title'
+        entry.save()
+        doc = minidom.parseString(self.client.get('/item-cache/atom/').content)
+        titles = [e.firstChild.wholeText for e in doc.getElementsByTagName('title')]
+        self.assertTrue('Changed title' in titles)
+        
+        key = records.object_key(entry)
+        self.assertTrue(key in records.item_cache.records)
+        entry.delete()
+        self.assertFalse(key in records.item_cache.records)
+
+class HeaderCacheTest(FeedTestCase):
+    """
+    Tests for caching the channel headers of feeds.
+    """
+    
+    def setUp(self):
+        records.header_cache.clear()
+    
+    def tearDown(self):
+        records.header_cache.clear()
+    
+    def test_cached_header(self):
+        """
+        Test that feeds with a cached header are written as before.
+        """
+        for feed_type in ('rss2', 'atom'):
+            path = '/cached-header/%s/' % feed_type
+            expected = self.client.get('/%s/' % feed_type).content.replace('/%s/' % feed_type, path)
+            self.assertEqual(self.client.get(path).content, expected)
+            self.assertEqual(self.client.get(path).content, expected)
+        self.assertEqual(records.header_cache.misses, 2)
+        self.assertEqual(records.header_cache.hits, 2)
+    
+    def test_date_spliced(self):
+        """
+        Test that the build date still follows the items.
+        """
+        self.client.get('/cached-header/atom/')
+        Entry.objects.create(title='New entry', date=datetime.datetime(2010, 1, 1, 12, 30))
+        doc = minidom.parseString(self.client.get('/cached-header/atom/').content)
+        updated = doc.getElementsByTagName('feed')[0].getElementsByTagName('updated')[0]
+        self.assertTrue(updated.firstChild.wholeText.startswith('2010-01-01T12:30:00'))
+        self.assertEqual(records.header_cache.hits, 1)
+    
+    def test_invalidation(self):
+        """
+        Test that saving the feed's object drops its cached header.
+        """
+        self.client.get('/cached-header/entry/1/')
+        entry = Entry.objects.get(pk=1)
+        entry.title = 'Changed title'
+        entry.save()
+        doc = minidom.parseString(self.client.get('/cached-header/entry/1/').content)
+        self.assertEqual(doc.getElementsByTagName('title')[0].firstChild.wholeText, 'Changed title')
+        self.assertEqual(records.header_cache.hits, 0)
+
+######################################
+# Metrics
+######################################
+
+class MetricsTest(FeedTestCase):
+    """
+    Tests for the runtime metrics of feeds.
+    """
+    
+    def setUp(self):
+        metrics.registry.reset()
+        self.old_middleware = settings.MIDDLEWARE_CLASSES
+        self.old_use_etags = settings.USE_ETAGS
+        settings.MIDDLEWARE_CLASSES = (
+            'syndication.metrics.MetricsMiddleware',
+            'django.middleware.http.ConditionalGetMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        )
+        settings.USE_ETAGS = True
+        self.client = Client()
+    
+    def tearDown(self):
+        settings.MIDDLEWARE_CLASSES = self.old_middleware
+        settings.USE_ETAGS = self.old_use_etags
+        metrics.registry.reset()
+    
+    def test_counters(self):
+        response = self.client.get('/rss2/')
+        self.client.get('/rss2/', HTTP_IF_NONE_MATCH=response['ETag'])
+        labels = (('feed', 'syndication.tests.feeds.TestRss2Feed'),
+                  ('feed_type', 'syndication.feedgenerator.Rss201rev2Feed'))
+        self.assertEqual(metrics.registry.value('syndication_requests_total', labels), 2)
+        self.assertEqual(metrics.registry.value('syndication_not_modified_total', labels), 1)
+        self.assertEqual(metrics.registry.value('syndication_items_total', labels),
+                         2 * Entry.objects.count())
+        
+        labels = (('feed_type', 'syndication.feedgenerator.Rss201rev2Feed'),)
+        self.assertEqual(metrics.registry.value('syndication_written_items_total', labels),
+                         2 * Entry.objects.count())
+        self.assertEqual(metrics.registry.value('syndication_written_bytes_total', labels),
+                         2 * len(response.content))
+    
+    def test_exposition(self):
+        self.client.get('/atom/')
+        content = self.client.get('/metrics/').content
+        labels = 'feed="syndication.tests.feeds.TestAtomFeed",feed_type="syndication.feedgenerator.Atom1Feed"'
+        self.assertTrue('# TYPE syndication_requests_total counter\n' in content)
+        self.assertTrue('\nsyndication_requests_total{%s} 1\n' % labels in content)
+        self.assertTrue('\nsyndication_generation_seconds_bucket{%s,le="+Inf"} 1\n' % labels in content)
+        self.assertTrue('\nsyndication_generation_seconds_count{%s} 1\n' % labels in content)
+    
+    def test_disabled(self):
+        metrics.registry.enabled = False
+        try:
+            self.client.get('/rss2/')
+        finally:
+            metrics.registry.enabled = True
+        self.assertEqual(metrics.registry.render(), '\n')
+
+######################################
+# Regeneration
+######################################
+
+def make_request(path):
+    request = HttpRequest()
+    request.path = path
+    request.META = {'SERVER_NAME': 'testserver', 'SERVER_PORT': '80'}
+    return request
+
+def poll_concurrently(feed, path, count):
+    """
+    Requests path from feed in count threads, making sure they all arrive
+    while the first one is generating the feed. Returns the responses.
+    """
+    feed.gate = threading.Event()
+    responses = []
+    def poll():
+        responses.append(feed(make_request(path)).content)
+    threads = [threading.Thread(target=poll) for i in range(count)]
+    threads[0].start()
+    while not feed.generated:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.2)
+    feed.gate.set()
+    for thread in threads:
+        thread.join()
+    feed.gate = None
+    return responses
+
+class RegenerationTest(TestCase):
+    """
+    Tests for single-flight regeneration of feeds.
+    """
+    
+    def test_single_flight(self):
+        """
+        Test that concurrent identical requests only generate the feed once.
+        """
+        feed = SlowFeed()
+        responses = poll_concurrently(feed, '/slow/', 5)
+        self.assertEqual(feed.generated, 1)
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(len(set(responses)), 1)
+        
+        # Once the feed has expired it is generated again.
+        feed(make_request('/slow/'))
+        self.assertEqual(feed.generated, 2)
+        # Different paths are different feeds.
+        feed(make_request('/slow/other/'))
+        self.assertEqual(feed.generated, 3)
+    
+    def test_cache_timeout(self):
+        feed = SlowFeed(cache_timeout=60)
+        content = feed(make_request('/slow/')).content
+        self.assertEqual(feed(make_request('/slow/')).content, content)
+        self.assertEqual(feed.generated, 1)
+    
+    def test_query_string(self):
+        """
+        Test that requests with different query strings are cached apart.
+        """
+        feed = SlowFeed(cache_timeout=60)
+        def request(query):
+            request = make_request('/slow/')
+            request.GET = QueryDict(query)
+            return request
+        tagged = feed(request('tag=a&page=1')).content
+        self.assertNotEqual(feed(request('tag=b&page=1')).content, tagged)
+        self.assertEqual(feed(request('page=1&tag=a')).content, tagged)
+        self.assertEqual(feed.generated, 2)
+    
+    def test_stale_while_revalidate(self):
+        """
+        Test that the previous body is served while another request is
+        regenerating the feed.
+        """
+        feed = SlowFeed(stale_while_revalidate=60)
+        request = make_request('/slow/')
+        content = feed(request).content
+        key = feed.get_cache_key(request)
+        feed.regeneration_lock.acquire(key)
+        try:
+            self.assertEqual(feed(make_request('/slow/')).content, content)
+        finally:
+            feed.regeneration_lock.release(key)
+        self.assertEqual(feed.generated, 1)
+        self.assertNotEqual(feed(make_request('/slow/')).content, content)
+        self.assertEqual(feed.generated, 2)
+    
+    def test_file_locks(self):
+        directory = tempfile.mkdtemp()
+        try:
+            feed = SlowFeed(regeneration_lock=locks.FileLocks(directory))
+            other = locks.FileLocks(directory)
+            self.assertTrue(other.acquire('key'))
+            self.assertFalse(feed.regeneration_lock.acquire('key', blocking=False))
+            other.release('key')
+            self.assertTrue(feed.regeneration_lock.acquire('key', blocking=False))
+            feed.regeneration_lock.release('key')
+            
+            responses = poll_concurrently(feed, '/slow/', 3)
+            self.assertEqual(feed.generated, 1)
+            self.assertEqual(len(set(responses)), 1)
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_snapshots(self):
+        """
+        Test that feeds are served from snapshots, also after a restart.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            feed = SlowFeed(feed_cache=snapshots.SnapshotStore(directory), cache_timeout=60)
+            content = feed(make_request('/slow/')).content
+            response = feed(make_request('/slow/'))
+            self.assertEqual(feed.generated, 1)
+            self.assertEqual(response['Content-Type'], 'application/rss+xml')
+            self.assertEqual(response['Content-Length'], str(len(content)))
+            self.assertEqual(response.content, content)
+            
+            # A new worker uses the snapshot of the previous one.
+            feed = SlowFeed(feed_cache=snapshots.SnapshotStore(directory), cache_timeout=60)
+            self.assertEqual(feed(make_request('/slow/')).content, content)
+            self.assertEqual(feed.generated, 0)
+            
+            # Only the current and the previous body are kept.
+            for i in range(3):
+                feed.feed_cache.set('key', cache.CachedFeed('body %d' % i, 'text/plain'))
+            self.assertEqual(feed.feed_cache.get('key').body, 'body 2')
+            name = feed.feed_cache.name('key')
+            self.assertEqual(len([f for f in os.listdir(directory)
+                                  if f.startswith(name) and f.endswith('.body')]), 2)
+            self.assertEqual(len([f for f in os.listdir(directory) if f.startswith('.tmp')]), 0)
+            
+            # Writes don't list the directory.
+            def bodies():
+                return sorted([open(os.path.join(directory, f)).read()
+                               for f in os.listdir(directory)
+                               if f.startswith(name) and f.endswith('.body')])
+            listdir = os.listdir
+            def fail(path):
+                raise AssertionError('The directory was listed.')
+            os.listdir = fail
+            try:
+                feed.feed_cache.set('key', cache.CachedFeed('body 1', 'text/plain'))
+            finally:
+                os.listdir = listdir
+            self.assertEqual(bodies(), ['body 1', 'body 2'])
+            os.listdir = fail
+            try:
+                feed.feed_cache.set('key', cache.CachedFeed('body 3', 'text/plain'))
+            finally:
+                os.listdir = listdir
+            self.assertEqual(bodies(), ['body 1', 'body 3'])
+            self.assertEqual(feed.feed_cache.get('key').body, 'body 3')
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_concurrent_snapshot_writers(self):
+        """
+        Test that two stores writing the same key don't remove the body the
+        other made current.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            other = snapshots.SnapshotStore(directory)
+            threads = []
+            class InterleavedStore(snapshots.SnapshotStore):
+                def write(self, path, data):
+                    snapshots.SnapshotStore.write(self, path, data)
+                    if path.endswith('.index') and not threads:
+                        # The other writer sets the key before this one
+                        # cleans up.
+                        threads.append(threading.Thread(target=other.set,
+                            args=('key', cache.CachedFeed('other', 'text/plain'))))
+                        threads[0].start()
+                        time.sleep(0.2)
+            store = InterleavedStore(directory)
+            store.set('key', cache.CachedFeed('body', 'text/plain'))
+            threads[0].join()
+            self.assertEqual(store.get('key').body, 'other')
+            self.assertEqual(store.get('key').response().content, 'other')
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_missing_snapshot(self):
+        """
+        Test that a feed whose snapshot body was removed is regenerated.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            feed = SlowFeed(feed_cache=snapshots.SnapshotStore(directory), cache_timeout=60)
+            feed(make_request('/slow/'))
+            for filename in os.listdir(directory):
+                if filename.endswith('.body'):
+                    os.remove(os.path.join(directory, filename))
+            self.assertTrue(feed(make_request('/slow/')).content)
+            self.assertEqual(feed.generated, 2)
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_snapshot_middleware(self):
+        """
+        Test that snapshots are sent whole through middleware that reads
+        the content, and get the ETag CommonMiddleware would give them.
+        """
+        directory = tempfile.mkdtemp()
+        old_middleware, old_etags = settings.MIDDLEWARE_CLASSES, settings.USE_ETAGS
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.gzip.GZipMiddleware',
+            'django.middleware.common.CommonMiddleware',
+            'django.middleware.http.ConditionalGetMiddleware',
+        )
+        settings.USE_ETAGS = True
+        TestSnapshotFeed.feed_cache = snapshots.SnapshotStore(directory)
+        try:
+            content = self.client.get('/snapshot/').content
+            response = self.client.get('/snapshot/')
+            self.assertEqual(response.content, content)
+            self.assertEqual(response['Content-Length'], str(len(content)))
+            self.assertEqual(response['ETag'], '"%s"' % md5_constructor(content).hexdigest())
+            response = self.client.get('/snapshot/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            
+            response = self.client.get('/snapshot/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.GzipFile(fileobj=StringIO(response.content)).read(), content)
+        finally:
+            TestSnapshotFeed.feed_cache = None
+            settings.MIDDLEWARE_CLASSES, settings.USE_ETAGS = old_middleware, old_etags
+            shutil.rmtree(directory)
+    
+    def test_snapshot_sendfile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = snapshots.SnapshotStore(directory, sendfile_header='X-Accel-Redirect',
+                                            sendfile_prefix='/internal/feeds/')
+            feed = SlowFeed(feed_cache=store, cache_timeout=60)
+            content = feed(make_request('/slow/')).content
+            response = feed(make_request('/slow/'))
+            self.assertEqual(response.content, '')
+            location = response['X-Accel-Redirect']
+            self.assertTrue(location.startswith('/internal/feeds/'))
+            self.assertEqual(open(os.path.join(directory, location[16:])).read(), content)
+        finally:
+            shutil.rmtree(directory)
+
+class SharedMemoryStoreTest(TestCase):
+    """
+    Tests for the feed store shared between processes.
+    """
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'feeds.cache')
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def test_shared_between_processes(self):
+        store = sharedcache.SharedMemoryStore(self.path, slots=16, slot_size=4096)
+        store.get('warm')
+        pid = os.fork()
+        if not pid:
+            try:
+                store.set('key', cache.CachedFeed('<rss/>', 'application/rss+xml',
+                                                  created=10.0, expires=None))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        entry = store.get('key')
+        self.assertEqual(entry.body, '<rss/>')
+        self.assertEqual(entry.content_type, 'application/rss+xml')
+        self.assertEqual((entry.created, entry.expires), (10.0, None))
+        
+        store.delete('key')
+        self.assertEqual(store.get('key'), None)
+    
+    def test_eviction(self):
+        store = sharedcache.SharedMemoryStore(self.path, slots=2, slot_size=64, ways=2)
+        store.set('a', cache.CachedFeed('a', 'text/plain'))
+        store.set('b', cache.CachedFeed('b', 'text/plain'))
+        time.sleep(0.01)
+        store.get('a')
+        store.set('c', cache.CachedFeed('c', 'text/plain'))
+        self.assertEqual(store.get('a').body, 'a')
+        self.assertEqual(store.get('b'), None)
+        self.assertEqual(store.get('c').body, 'c')
+        # Bodies that don't fit in a slot aren't stored.
+        store.set('d', cache.CachedFeed('d' * 64, 'text/plain'))
+        self.assertEqual(store.get('d'), None)
+    
+    def test_write_in_progress(self):
+        store = sharedcache.SharedMemoryStore(self.path, slots=8, slot_size=64)
+        store.set('key', cache.CachedFeed('body', 'text/plain'))
+        offset = [o for o in store.offsets(store.digest('key'))
+                  if sharedcache.SLOT_HEADER.unpack_from(store.map, o)[1] == store.digest('key')][0]
+        sequence = sharedcache.SEQUENCE.unpack_from(store.map, offset)[0]
+        sharedcache.SEQUENCE.pack_into(store.map, offset, sequence + 1)
+        self.assertEqual(store.get('key'), None)
+        sharedcache.SEQUENCE.pack_into(store.map, offset, sequence + 2)
+        self.assertEqual(store.get('key').body, 'body')
+    
+    def test_feed_cache(self):
+        feed = SlowFeed(feed_cache=sharedcache.SharedMemoryStore(self.path), cache_timeout=60)
+        content = feed(make_request('/slow/')).content
+        other = SlowFeed(feed_cache=sharedcache.SharedMemoryStore(self.path), cache_timeout=60)
+        self.assertEqual(other(make_request('/slow/')).content, content)
+        self.assertEqual(other.generated, 0)
+        
+        self.assertRaises(ImproperlyConfigured,
+                          sharedcache.SharedMemoryStore(self.path, slots=16).get, 'key')
+
+######################################
+# Thread safety
+######################################
+
+class FeedStateTest(TestCase):
+    """
+    Tests for sharing a Feed instance between threads.
+    """
+    
+    def test_feed_state(self):
+        feed = StateFeed()
+        doc = minidom.parseString(feed(make_request('/state/a/'), 'a').content)
+        chan = doc.getElementsByTagName('channel')[0]
+        self.assertEqual(chan.getElementsByTagName('title')[0].firstChild.wholeText, 'A feed for a')
+        self.assertEqual(chan.getElementsByTagName('link')[0].firstChild.wholeText,
+                         'http://testserver/state/a/')
+        item = chan.getElementsByTagName('item')[1]
+        self.assertEqual(item.getElementsByTagName('title')[0].firstChild.wholeText, 'a-1 of A')
+        self.assertEqual(item.getElementsByTagName('description')[0].firstChild.wholeText, '2 of 5')
+    
+    def test_concurrent_requests(self):
+        """
+        Test that concurrent requests to one instance don't see each other's
+        state.
+        """
+        feed = StateFeed()
+        names = ['feed%d' % i for i in range(8)]
+        expected = dict([(name, feed(make_request('/state/%s/' % name), name).content)
+                         for name in names])
+        errors = []
+        def poll(name):
+            try:
+                for i in range(25):
+                    content = feed(make_request('/state/%s/' % name), name).content
+                    if content != expected[name]:
+                        errors.append(name)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=poll, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+    
+    def test_old_signatures(self):
+        """
+        Test that overrides written before FeedState are still called.
+        """
+        class OldFeed(views.Feed):
+            title = link = description = '/old/'
+            def get_object(self, request, name):
+                return name
+            def get_items(self, obj, limit=None):
+                return ['old']
+            def item_title(self, item):
+                return item.upper()
+            def item_description(self, item):
+                return item
+            def item_link(self, item):
+                return '/old/'
+        content = OldFeed()(make_request('/state/old/'), 'old').content
+        self.failUnless('<title>OLD</title>' in content)
+
+######################################
+# Scheduler
+######################################
+
+class SchedulerTest(TestCase):
+    """
+    Tests for regenerating feeds in the background.
+    """
+    
+    def test_run_pending(self):
+        """
+        Test that scheduled feeds are served from the scheduler's store.
+        """
+        feed = SlowFeed(feed_cache=None, regeneration_lock=None, ttl=5)
+        s = scheduler.FeedScheduler()
+        s.register(feed, '/slow/', host='testserver')
+        s.run_pending()
+        self.assertEqual(feed.generated, 1)
+        self.assertEqual(s.due(), [])
+        content = feed(make_request('/slow/')).content
+        self.assertEqual(feed(make_request('/slow/')).content, content)
+        self.assertEqual(feed.generated, 1)
+        
+        stats = s.stats()[0]
+        self.assertEqual(stats['interval'], 300)
+        self.assertEqual(stats['runs'], 1)
+        self.assertEqual(stats['requests'], 2)
+        self.assertTrue(stats['last_duration'] >= 0)
+    
+    def test_adaptive_interval(self):
+        """
+        Test that feeds without a ttl are regenerated more often when they
+        change and less often when they don't.
+        """
+        s = scheduler.FeedScheduler(min_interval=10, max_interval=100)
+        changing = s.register(SlowFeed(feed_cache=None), '/slow/')
+        unchanging = s.register(SlowFeed(feed_cache=None, items=['Same']), '/same/')
+        for i in range(5):
+            for scheduled in s.feeds:
+                s.run(scheduled)
+        self.assertEqual(changing.interval, 10)
+        self.assertEqual(unchanging.interval, 100)
+    
+    def test_priority(self):
+        """
+        Test that the most requested feeds are regenerated first.
+        """
+        s = scheduler.FeedScheduler()
+        quiet = s.register(SlowFeed(feed_cache=None), '/quiet/')
+        popular = s.register(SlowFeed(feed_cache=None), '/popular/', host='testserver')
+        for i in range(3):
+            popular.feed(make_request('/popular/'))
+        self.assertEqual(s.due(), [popular, quiet])
+    
+    def test_threads(self):
+        feed = SlowFeed(feed_cache=None)
+        s = scheduler.FeedScheduler(workers=2)
+        scheduled = s.register(feed, '/slow/')
+        s.start()
+        try:
+            for i in range(100):
+                if scheduled.runs:
+                    break
+                time.sleep(0.05)
+        finally:
+            s.stop()
+        self.assertEqual(scheduled.runs, 1)
+        self.assertEqual(s.threads, [])
+
+######################################
+# Materialized feeds
+######################################
+
+class MaterializedFeedTest(FeedTestCase):
+    """
+    Tests for feeds served from fragments serialized on save.
+    """
+    
+    def assertMaterialized(self, feed, titles):
+        request = make_request('/materialized/')
+        content = feed(request).content
+        doc = minidom.parseString(content)
+        items = doc.getElementsByTagName('item')
+        self.assertEqual([item.getElementsByTagName('title')[0].firstChild.wholeText
+                          for item in items], titles)
+        # The output is the same as if the items were resolved now.
+        resolved = feed.resolved
+        expected = feed.get_feed(None, request, list(feed.items()[:3])).writeString('utf-8')
+        feed.resolved = resolved
+        self.assertEqual(content, expected)
+    
+    def test_materialized_feed(self):
+        feed = TestMaterializedFeed()
+        self.assertMaterialized(feed, ['A &amp; B &lt; C &gt; D', 'My third entry', 'My second entry'])
+        self.assertEqual(feed.resolved, 3)
+        self.assertMaterialized(feed, ['A &amp; B &lt; C &gt; D', 'My third entry', 'My second entry'])
+        self.assertEqual(feed.resolved, 3)
+        
+        # New and changed items are serialized when they are saved.
+        entry = Entry.objects.create(title='New entry', date=datetime.datetime(2010, 1, 1))
+        self.assertEqual(feed.resolved, 4)
+        self.assertMaterialized(feed, ['New entry', 'A &amp; B &lt; C &gt; D', 'My third entry'])
+        entry.title = 'Newer entry'
+        entry.save()
+        self.assertEqual(feed.resolved, 5)
+        self.assertMaterialized(feed, ['Newer entry', 'A &amp; B &lt; C &gt; D', 'My third entry'])
+        # Old items don't get in.
+        Entry.objects.create(title='Old entry', date=datetime.datetime(2000, 1, 1))
+        self.assertMaterialized(feed, ['Newer entry', 'A &amp; B &lt; C &gt; D', 'My third entry'])
+        
+        # Items leaving a full ring are replaced from the database.
+        entry.title = 'Draft entry'
+        entry.save()
+        self.assertMaterialized(feed, ['A &amp; B &lt; C &gt; D', 'My third entry', 'My second entry'])
+        Entry.objects.get(pk=4).delete()
+        self.assertMaterialized(feed, ['My third entry', 'My second entry', 'My first entry'])
+    
+    def test_update_errors(self):
+        """
+        Test that a ring that fails to update doesn't make saving fail, and
+        is built again when the feed is next requested.
+        """
+        feed = TestMaterializedFeed()
+        self.assertMaterialized(feed, ['A &amp; B &lt; C &gt; D', 'My third entry', 'My second entry'])
+        feed.error = ValueError('Resolver failed.')
+        Entry.objects.create(title='New entry', date=datetime.datetime(2010, 1, 1))
+        self.assertEqual(feed.load_ring(None), None)
+        feed.error = None
+        self.assertMaterialized(feed, ['New entry', 'A &amp; B &lt; C &gt; D', 'My third entry'])
+    
+    def test_fragment_ring(self):
+        ring = materialized.FragmentRing(2)
+        ring.insert(None, 'a', u'<a/>')
+        ring.insert(10, 'b', u'<b/>')
+        ring.insert(5, 'c', u'<c/>')
+        self.assertEqual([entry[1] for entry in ring.entries], ['b', 'c'])
+        ring.insert(20, 'c', u'<c2/>')
+        self.assertEqual(ring.entries, [(20, 'c', u'<c2/>'), (10, 'b', u'<b/>')])
+        self.failUnless(ring.is_full())
+        self.failUnless(ring.remove('b'))
+        self.failIf(ring.remove('b'))
+        ring = materialized.FragmentRing.loads(2, ring.dumps())
+        self.assertEqual(ring.entries, [(20, u'c', u'<c2/>')])
+
+######################################
+# Surrogate keys and purging
+######################################
+
+class PurgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_PURGE(self):
+        self.server.purged.append((self.path, self.headers.get('Surrogate-Key')))
+        self.send_response(200)
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+class PurgeTest(FeedTestCase):
+    """
+    Tests for surrogate key headers and the purge API.
+    """
+    
+    def setUp(self):
+        # A stand-in for a caching proxy.
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), PurgeHandler)
+        self.server.purged = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.endpoint = 'http://127.0.0.1:%d/purge/' % self.server.server_port
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+    
+    def test_surrogate_keys(self):
+        expected = ' '.join(['feed-syndication.tests.feeds.TestSurrogateKeyFeed'] +
+                            ['tests_entry-%d' % e.pk for e in Entry.objects.all()] +
+                            ['tests_entry'])
+        feed = TestSurrogateKeyFeed()
+        self.assertEqual(feed(make_request('/rss2/'))['Surrogate-Key'], expected)
+        self.failIf(self.client.get('/rss2/').has_header('Surrogate-Key'))
+        
+        # The header is kept with stored feeds.
+        directory = tempfile.mkdtemp()
+        try:
+            for store in (cache.MemoryStore(), snapshots.SnapshotStore(directory),
+                          sharedcache.SharedMemoryStore(os.path.join(directory, 'shm'), slots=16)):
+                feed.feed_cache = store
+                feed.cache_timeout = 60
+                feed(make_request('/rss2/'))
+                self.assertEqual(feed(make_request('/rss2/'))['Surrogate-Key'], expected)
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_purge(self):
+        purger = purge.Purger(self.endpoint)
+        entry = Entry.objects.get(pk=1)
+        self.assertEqual(purger.keys_for(entry), ['tests_entry-1', 'tests_entry'])
+        self.failUnless(purger.purge_feed(TestSurrogateKeyFeed()))
+        self.assertEqual(self.server.purged, [
+            ('/purge/', 'feed-syndication.tests.feeds.TestSurrogateKeyFeed')])
+        
+        purger.connect(Entry)
+        try:
+            entry.save()
+            entry.delete()
+        finally:
+            purger.disconnect(Entry)
+        Entry.objects.get(pk=2).save()
+        # Updates purge the feeds that list entries too, since the entry
+        # may now belong in them.
+        self.assertEqual(self.server.purged[1:], [('/purge/', 'tests_entry-1 tests_entry')] * 2)
+        
+        # A new entry purges the feeds that list entries.
+        purger.connect(Entry)
+        try:
+            entry = Entry.objects.create(title='New entry', date=datetime.datetime(2010, 1, 1))
+        finally:
+            purger.disconnect(Entry)
+        self.assertEqual(self.server.purged[3:], [
+            ('/purge/', 'tests_entry-%d tests_entry' % entry.pk)])
+        self.failUnless('tests_entry' in
+                        TestSurrogateKeyFeed()(make_request('/rss2/'))['Surrogate-Key'].split())
+        
+        # Purgers can purge less on updates.
+        class CreationPurger(purge.Purger):
+            def membership_keys(self, instance, created=False, deleted=False):
+                if created or deleted:
+                    return [purge.model_surrogate_key(instance)]
+                return []
+        self.assertEqual(CreationPurger(self.endpoint).keys_for(entry), ['tests_entry-%d' % entry.pk])
+        self.assertEqual(CreationPurger(self.endpoint).keys_for(entry, created=True),
+                         ['tests_entry-%d' % entry.pk, 'tests_entry'])
+        
+        purger.max_keys = 2
+        self.failUnless(purger.purge_keys(['a', 'b', 'c']))
+        self.assertEqual(self.server.purged[4:], [('/purge/', 'a b'), ('/purge/', 'c')])
+        
+        # Failures are logged, not raised.
+        self.failIf(purge.Purger('http://127.0.0.1:1/', timeout=1).purge_keys(['a']))
+
+######################################
+# Aggregated feeds
+######################################
+
+class AggregateFeedTest(FeedTestCase):
+    """
+    Tests for feeds aggregating the items of other feeds.
+    """
+    
+    def test_merge(self):
+        first = PlanetSourceFeed('first', [('a', 23), ('b', 20), ('c', 5), ('d', 4), ('e', 3)])
+        second = PlanetSourceFeed('second', [('f', 22), ('b', 20), ('g', 10), ('h', 1)])
+        third = PlanetSourceFeed('third', [])
+        feed = PlanetFeed()
+        feed.sources = (first, second, third)
+        
+        doc = minidom.parseString(feed(make_request('/planet/')).content)
+        items = doc.getElementsByTagName('item')
+        self.assertEqual([i.getElementsByTagName('title')[0].firstChild.wholeText for i in items],
+                         ['first: a', 'second: f', 'first: b', 'second: g'])
+        # Only the items needed were fetched: the four above, the duplicate
+        # of b, a fifth to tell the feed was truncated and one read ahead.
+        self.assertEqual(first.fetched + second.fetched, 7)
+    
+    def test_merge_newest_first(self):
+        utc = tzinfo.FixedOffset(0)
+        plus_two = tzinfo.FixedOffset(120)
+        streams = [
+            [(datetime.datetime(2010, 1, 1, 12, tzinfo=utc), 1),
+             (None, 4)],
+            [(datetime.datetime(2010, 1, 1, 13, tzinfo=plus_two), 2),
+             (datetime.datetime(2010, 1, 1, 10, 30, tzinfo=plus_two), 3)],
+        ]
+        self.assertEqual([v for d, v in aggregate.merge_newest_first(streams)], [1, 2, 3, 4])
+
+######################################
+# Bulk generation
+######################################
+
+class BulkGenerationTest(FeedTestCase):
+    """
+    Tests for generating the feeds of many objects at once.
+    """
+    
+    def test_generate_many(self):
+        feed = TestBulkFeed()
+        request = make_request('/bulk/')
+        entries = list(Entry.objects.all())
+        feeds = feed.generate_many(request, entries)
+        self.assertEqual(feed.queries, 1)
+        self.assertEqual(feed.resolved, len(entries))
+        
+        self.assertEqual(len(feeds), len(entries))
+        for entry in entries:
+            path = '/bulk/%d/' % entry.pk
+            self.assertEqual(feeds[entry],
+                             feed.get_feed(entry, make_request(path)).writeString('utf-8'))
+            doc = minidom.parseString(feeds[entry])
+            self.assertEqual(len(doc.getElementsByTagName('item')),
+                             Entry.objects.filter(date__lte=entry.date).count())
+            # Each feed links to itself.
+            self_link = doc.getElementsByTagName('atom:link')[0]
+            self.assertEqual(self_link.getAttribute('href'), 'http://testserver' + path)
+        self.assertEqual(request.path, '/bulk/')
+    
+    def test_state_resolvers(self):
+        """
+        Test that items aren't shared between feeds if their resolvers take
+        the FeedState.
+        """
+        feed = TestBulkStateFeed()
+        entries = list(Entry.objects.all())
+        feeds = feed.generate_many(make_request('/bulk/'), entries)
+        for entry in entries:
+            titles = [node.firstChild.wholeText for node in
+                      minidom.parseString(feeds[entry]).getElementsByTagName('title')[1:]]
+            self.assertTrue(titles)
+            for title in titles:
+                self.assertTrue(title.endswith(u' in %s' % entry.title), title)
+    
+    def test_max_items(self):
+        feed = TestBulkFeed()
+        feed.max_items = 2
+        feeds = feed.generate_many(make_request('/bulk/'), Entry.objects.all())
+        for content in feeds.values():
+            self.assertTrue(len(minidom.parseString(content).getElementsByTagName('item')) <= 2)
+
+######################################
+# Enclosures
+######################################
+
+class EnclosureResolverTest(FeedTestCase):
+    """
+    Tests for enclosures of local media files.
+    """
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for pk in (1, 2):
+            f = open(os.path.join(self.root, 'entry %s.mp3' % pk), 'wb')
+            f.write('x' * 100 * pk)
+            f.close()
+        self.resolver = enclosures.EnclosureResolver(self.root, 'http://media.example.com/')
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def test_enclosures(self):
+        feed = TestEnclosurePathFeed()
+        feed.enclosure_resolver = self.resolver
+        doc = minidom.parseString(feed(make_request('/enclosures/')).content)
+        found = [(e.getAttribute('url'), e.getAttribute('length'), e.getAttribute('type'))
+                 for e in doc.getElementsByTagName('enclosure')]
+        self.assertEqual(found, [
+            (u'http://media.example.com/entry%201.mp3', u'100', u'audio/mpeg'),
+            (u'http://media.example.com/entry%202.mp3', u'200', u'audio/mpeg'),
+        ])
+        # The third and fourth entries have no media file.
+        self.assertEqual(len(doc.getElementsByTagName('item')), Entry.objects.count())
+        
+        # The files are only checked again once check_interval has passed.
+        stats = self.resolver.stats
+        feed(make_request('/enclosures/'))
+        self.assertEqual(self.resolver.stats, stats)
+    
+    def test_revalidation(self):
+        path = os.path.join(self.root, 'entry 1.mp3')
+        self.assertEqual(self.resolver.lookup('entry 1.mp3', now=1000), (100, 'audio/mpeg'))
+        self.assertEqual(self.resolver.lookup('entry 1.mp3', now=1059), (100, 'audio/mpeg'))
+        self.assertEqual(self.resolver.stats, 1)
+        
+        f = open(path, 'ab')
+        f.write('x' * 50)
+        f.close()
+        self.assertEqual(self.resolver.lookup('entry 1.mp3', now=1060), (150, 'audio/mpeg'))
+        os.remove(path)
+        self.assertEqual(self.resolver.lookup('entry 1.mp3', now=1120), None)
+        self.assertEqual(self.resolver.stats, 3)
+
+######################################
+# Warm-up
+######################################
+
+class WarmUpTest(FeedTestCase):
+    """
+    Tests for warming up the feeds in a URLconf.
+    """
+    
+    def tearDown(self):
+        views.preloaded_templates.clear()
+    
+    def test_find_feeds(self):
+        found = dict([(name, (path, target)) for name, path, target in warmup.find_feeds()])
+        path, target = found['syndication.tests.feeds.TestRss2Feed (^rss2/$)']
+        self.assertEqual(path, '/rss2/')
+        self.assertEqual(target.__class__.__name__, 'TestRss2Feed')
+        path, target = found['syndication.tests.feeds.ComplexFeed (^complex/(?P<foo>.*)/$)']
+        self.assertEqual(path, None)
+        path, target = found["syndication.tests.feeds.DepreciatedRssFeed (^depr-feeds/(?P<url>.*)/$, slug 'rss')"]
+        self.assertEqual(target[0], 'rss')
+        self.assertEqual(target[1].__name__, 'DepreciatedRssFeed')
+    
+    def test_warm_up(self):
+        views.compiled_link_patterns.clear()
+        views.compiled_feed_dicts.clear()
+        results = warmup.warm_up()
+        # Link patterns and feed_dict routes are compiled.
+        self.assertEqual([key[:3] for key in views.compiled_link_patterns],
+                         [('test-entry', ('pk',), None)])
+        self.assertTrue(id(urls.feed_dict) in views.compiled_feed_dicts)
+        
+        results = warmup.warm_up(render=True)
+        self.assertEqual(len(results), len(warmup.find_feeds()))
+        errors = dict([(name, error) for name, seconds, error in results])
+        # ArticlesFeed can't be rendered, see test_item_link_error.
+        self.assertTrue(isinstance(errors.pop('syndication.tests.feeds.ArticlesFeed (^articles/$)'),
+                                   ImproperlyConfigured))
+        self.assertEqual(errors.values(), [None] * len(errors))
+        self.assertNotEqual(views.preloaded_templates['title.html'], None)
+        self.assertEqual(views.preloaded_templates['feeds/rss_title.html'], None)
+    
+    def test_preloaded_templates(self):
+        """
+        Test that feeds render the same with preloaded templates.
+        """
+        response = self.client.get('/template/')
+        warmup.warm_up()
+        self.assertEqual(self.client.get('/template/').content, response.content)
+
 ######################################
 # feedgenerator
 ######################################
@@ -346,6 +1478,102 @@ class FeedgeneratorTest(TestCase):
         )
 
 
+    def test_trusted_input(self):
+        """
+        Test that trusted mode only converts values that aren't already
+        normalised.
+        """
+        feed = feedgenerator.Rss201rev2Feed(
+            title='Trusted',
+            link=u'http://example.com/caf\xe9/',
+            description=u'Description',
+            feed_url='http://example.com/feed/',
+            trusted=True,
+        )
+        feed.add_item(title='Item', link='http://example.com/1/',
+                      description=u'Item description')
+        self.assertEqual(feed.feed['title'], u'Trusted')
+        self.assertTrue(isinstance(feed.feed['title'], unicode))
+        self.assertEqual(feed.feed['link'], 'http://example.com/caf%C3%A9/')
+        self.assertEqual(feed.feed['feed_url'], 'http://example.com/feed/')
+        item = feed.items[0]
+        self.assertTrue(isinstance(item['title'], unicode))
+        self.assertEqual(item['link'], 'http://example.com/1/')
+        self.assertEqual(item['author_link'], None)
+    
+    def test_custom_write(self):
+        """
+        Test that generators with a write() of their own that doesn't count
+        bytes still write their items.
+        """
+        class MinimalFeed(feedgenerator.Rss201rev2Feed):
+            def write(self, outfile, encoding):
+                handler = feedgenerator.SimplerXMLGenerator(outfile, encoding)
+                handler.startDocument()
+                handler.startElement(u'items', {})
+                self.write_items(handler)
+                handler.endElement(u'items')
+        feed = MinimalFeed(title=u'Title', link=u'http://example.com/', description=u'')
+        feed.max_bytes = 1
+        for i in range(2):
+            feed.add_item(title=u'Item %d' % i, link=u'http://example.com/%d/' % i,
+                          description=u'')
+        doc = minidom.parseString(feed.writeString('utf-8'))
+        self.assertEqual(len(doc.getElementsByTagName('item')), 2)
+    
+    def test_generate(self):
+        items = [{'title': u'Item %d' % i, 'link': u'http://example.com/%d/' % i,
+                  'description': u'Description %d' % i,
+                  'pubdate': datetime.datetime(2010, 1, i + 1)} for i in range(3)]
+        xml = feedgenerator.generate(feedgenerator.Atom1Feed, iter(items), max_items=2,
+                                     title=u'Title', link=u'http://example.com/',
+                                     description=u'Description')
+        entries = minidom.parseString(xml).getElementsByTagName('entry')
+        self.assertEqual([e.getElementsByTagName('title')[0].firstChild.wholeText for e in entries],
+                         ['Item 0', 'Item 1'])
+    
+    def test_standalone_import(self):
+        """
+        Test that the generators and the feed views can be imported, and
+        feeds generated, without settings.
+        """
+        code = '\n'.join([
+            'import sys',
+            'from syndication import feedgenerator, views',
+            'feedgenerator.generate(feedgenerator.DefaultFeed, [{"title": u"a", "link": u"/a/",',
+            '    "description": u""}], title=u"", link=u"/", description=u"", feed_url=u"/")',
+            'for name in ("django.contrib.sites", "django.db", "django.template"):',
+            '    assert name not in sys.modules, name',
+        ])
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        process = subprocess.Popen([sys.executable, '-c', code], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+    
+    def test_cdata_descriptions(self):
+        """
+        Test that long descriptions are written as CDATA sections.
+        """
+        description = u'<p>Caf\xe9 & <b>bar</b>, not ]]> the end.</p>'
+        for feed_type, name in ((feedgenerator.Rss201rev2Feed, 'description'),
+                                (feedgenerator.Atom1Feed, 'summary')):
+            feed = feed_type(title='CDATA', link='http://example.com/',
+                             description='Description', feed_url='http://example.com/feed/')
+            feed.cdata_threshold = 20
+            feed.add_item(title='Long', link='http://example.com/1/', description=description)
+            feed.add_item(title='Short', link='http://example.com/2/', description=u'<p>Short</p>')
+            content = feed.writeString('utf-8')
+            self.assertEqual(content.count('<![CDATA['), 2)
+            self.assertTrue('&lt;p&gt;Short' in content)
+            doc = minidom.parseString(content)
+            self.assertEqual([e.firstChild.wholeText for e in doc.getElementsByTagName(name)][-2:],
+                             [description, u'<p>Short</p>'])
+            # CDATA sections are only used for UTF-8 output.
+            self.assertFalse('<![CDATA[' in feed.writeString('ascii'))
+
 ######################################
 # Depreciated feeds
 ######################################
@@ -392,4 +1620,51 @@ class DepreciatedSyndicationFeedTest(FeedTestCase):
         """
         response = self.client.get('/depr-feeds/complex/')
         self.assertEquals(response.status_code, 404)
+    
+    def test_instance_reuse(self):
+        """
+        Test that feed instances are reused, but follow the request.
+        """
+        first = self.client.get('/depr-feeds/rss/')
+        routes = views.get_feed_routes(urls.feed_dict)
+        instance = routes.local.instances['rss']
+        self.assertEqual(instance.request, None)
+        
+        second = self.client.get('/depr-feeds/rss/foo/')
+        self.assertTrue(routes.local.instances['rss'] is instance)
+        self.assertEqual(instance.feed_url, '/depr-feeds/rss/foo/')
+        self.assertEqual(second.content,
+                         first.content.replace('/depr-feeds/rss/', '/depr-feeds/rss/foo/'))
+    
+    def test_slash_in_slug(self):
+        """
+        Test that a slug that can never match is rejected.
+        """
+        self.assertRaises(ImproperlyConfigured, views.FeedRoutes,
+                          {'rss/foo': DepreciatedRssFeed})
+
 
+
+######################################
+# Load testing tool
+######################################
+
+class LoadTestToolTest(TestCase):
+    """
+    Tests for the helpers of the load testing tool.
+    """
+    
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('/rss2/=3, /atom/'),
+                         [('/rss2/', 3), ('/atom/', 1)])
+        self.assertRaises(ValueError, loadtest.parse_mix, '')
+        self.assertRaises(ValueError, loadtest.parse_mix, 'rss2=1')
+        self.assertRaises(ValueError, loadtest.parse_mix, '/rss2/=0')
+    
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile(values, 100), 100)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertEqual(loadtest.percentile([], 50), None)
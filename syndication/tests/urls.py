@@ -9,7 +9,17 @@ feed_dict = {
 urlpatterns = patterns('',
     (r'^complex/(?P<foo>.*)/$', feeds.ComplexFeed()),
     (r'^rss2/$', feeds.TestRss2Feed()),
+    (r'^rss2-trusted/$', feeds.TestTrustedRss2Feed()),
+    (r'^max-items/$', feeds.TestMaxItemsFeed()),
+    (r'^max-bytes/$', feeds.TestMaxBytesFeed()),
+    (r'^item-cache/rss2/$', feeds.TestItemCacheFeed()),
+    (r'^item-cache/atom/$', feeds.TestItemCacheAtomFeed()),
+    (r'^cached-header/rss2/$', feeds.TestCachedHeaderFeed()),
+    (r'^cached-header/atom/$', feeds.TestCachedHeaderAtomFeed()),
+    (r'^cached-header/entry/(?P<pk>\d+)/$', feeds.TestEntryHeaderFeed()),
+    (r'^lite/$', feeds.TestLiteFeed.lite_variant()),
     (r'^rss091/$', feeds.TestRss091Feed()),
+    (r'^rss091-elision/$', feeds.TestRss091ElisionFeed()),
     (r'^atom/$', feeds.TestAtomFeed()),
     (r'^custom/$', feeds.TestCustomFeed()),
     (r'^naive-dates/$', feeds.NaiveDatesFeed()),
@@ -18,6 +28,14 @@ urlpatterns = patterns('',
     (r'^articles/$', feeds.ArticlesFeed()),
     (r'^template/$', feeds.TemplateFeed()),
     
+    (r'^link-pattern/$', feeds.TestLinkPatternFeed()),
+    (r'^adaptive-ttl/$', feeds.TestAdaptiveTtlFeed()),
+    (r'^snapshot/$', feeds.TestSnapshotFeed()),
+    url(r'^blog/(?P<pk>\d+)/$', 'django.views.generic.simple.redirect_to', {'url': None},
+        name='test-entry'),
+    
+    (r'^metrics/$', 'syndication.metrics.expose'),
+    
     (r'^depr-feeds/(?P<url>.*)/$', 'syndication.views.feed', {'feed_dict': feed_dict}),
     (r'^depr-feeds-empty/(?P<url>.*)/$', 'syndication.views.feed', {'feed_dict': None}),
 )
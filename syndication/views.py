@@ -1,14 +1,40 @@
+import calendar
+import copy
 import datetime
+import logging
+import threading
+import time
+# The sites framework, the ORM, the template system, the URL resolver and the
+# cache framework are imported through deferred() when they are first used,
+# so that importing this module neither needs settings nor loads them.
 from django.conf import settings
-from django.contrib.sites.models import Site, RequestSite
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.http import HttpResponse, Http404
-from django.template import loader, Template, TemplateDoesNotExist, RequestContext
 from django.utils import tzinfo
-from django.utils.encoding import force_unicode, iri_to_uri, smart_unicode
+from django.utils.encoding import force_unicode, iri_to_uri, smart_str, smart_unicode
 from django.utils.html import escape
+from django.utils.importlib import import_module
+from django.utils.http import http_date
+from django.utils.text import truncate_html_words
 
-from syndication import feedgenerator
+from syndication import cache, feedgenerator, metrics, purge, records
+
+logger = logging.getLogger('syndication')
+
+# Modules imported by deferred(), keyed by name.
+deferred_modules = {}
+
+
+def deferred(name):
+    """
+    Returns the named module, importing it the first time. Cheaper than an
+    import statement on paths that run for every item.
+    """
+    try:
+        return deferred_modules[name]
+    except KeyError:
+        module = deferred_modules[name] = import_module(name)
+        return module
 
 
 def add_domain(domain, url):
@@ -21,25 +47,450 @@ def add_domain(domain, url):
     return url
 
 
+def get_current_site(request):
+    """
+    Returns the current Site, or a RequestSite if the sites framework isn't
+    installed.
+    """
+    sites = deferred('django.contrib.sites.models')
+    if sites.Site._meta.installed:
+        return sites.Site.objects.get_current()
+    return sites.RequestSite(request)
+
+
+def effective_limit(value, default):
+    """
+    Combines a per-feed limit with a global default; the smaller one wins.
+    """
+    if value is None:
+        return default
+    if default is None:
+        return value
+    return min(value, default)
+
+
+def median_interval(pubdates, now=None):
+    """
+    Returns the median number of seconds between consecutive pubdates,
+    counting the time since the newest one as an interval too, or None if
+    there are no pubdates.
+    """
+    if now is None:
+        now = time.time()
+    times = []
+    for pubdate in pubdates:
+        if pubdate.tzinfo is None:
+            times.append(time.mktime(pubdate.timetuple()))
+        else:
+            times.append(calendar.timegm(pubdate.utctimetuple()))
+    if not times:
+        return None
+    times.sort()
+    times.append(max(now, times[-1]))
+    intervals = [later - earlier for earlier, later in zip(times, times[1:])]
+    intervals.sort()
+    middle = len(intervals) / 2
+    if len(intervals) % 2:
+        return intervals[middle]
+    return (intervals[middle - 1] + intervals[middle]) / 2.0
+
+
+# The optional arguments of the feed generator's __init__() and add_item()
+# that get_feed() resolves, and can leave out if the feed type doesn't write
+# them.
+OPTIONAL_FEED_FIELDS = ('subtitle', 'author_name', 'author_link', 'author_email',
+                        'categories', 'feed_copyright', 'feed_guid', 'ttl')
+OPTIONAL_ITEM_FIELDS = ('description', 'unique_id', 'enclosure', 'pubdate', 'author_name',
+                        'author_email', 'author_link', 'categories', 'item_copyright')
+# The generator methods that write the channel and the items. A subclass
+# that overrides them may write more than the fields its base class declares.
+FEED_WRITERS = ('write', 'write_header', 'start_root', 'root_attributes', 'rss_attributes',
+                'add_root_elements', 'add_date_element')
+ITEM_WRITERS = ('write', 'write_items', 'write_item', 'item_attributes', 'add_item_elements')
+
+
+def declared_fields(feed_type, attname, writers):
+    """
+    Returns the fields feed_type declares in attname (feed_fields or
+    item_fields), or None if it doesn't declare them, or a subclass of the
+    declaring class overrides one of writers without declaring its own.
+    """
+    for cls in getattr(feed_type, '__mro__', ()):
+        if attname in cls.__dict__:
+            return cls.__dict__[attname]
+        for name in writers:
+            if name in cls.__dict__:
+                return None
+    return None
+
+# The item attributes resolve_item() looks up.
+ITEM_RESOLVERS = ('item_title', 'item_description', 'item_link', 'item_guid', 'item_pubdate',
+                  'item_enclosure_url', 'item_enclosure_length', 'item_enclosure_mime_type',
+                  'item_enclosure_path', 'item_author_name', 'item_author_email',
+                  'item_author_link', 'item_categories', 'item_copyright')
+
+
+# Templates loaded ahead of time by preload_template(), keyed by name. None
+# means the template doesn't exist.
+preloaded_templates = {}
+
+
+def preload_template(name):
+    """
+    Loads a template and keeps it so get_feed() doesn't have to load it on
+    every request.
+    """
+    loader = deferred('django.template.loader')
+    try:
+        template = loader.get_template(name)
+    except loader.TemplateDoesNotExist:
+        template = None
+    preloaded_templates[name] = template
+    return template
+
+
+def find_template(name):
+    """
+    Returns the named template, or None if it doesn't exist.
+    """
+    if name is None:
+        return None
+    try:
+        return preloaded_templates[name]
+    except KeyError:
+        pass
+    loader = deferred('django.template.loader')
+    try:
+        return loader.get_template(name)
+    except loader.TemplateDoesNotExist:
+        return None
+
+
+# Format strings compiled by compile_link_pattern(), keyed by URL name, URL
+# arguments, domain, script prefix and URLconf.
+compiled_link_patterns = {}
+
+
+def compile_link_pattern(name, params, domain=None):
+    """
+    Returns a format string for links to the URL pattern called name, with a
+    %(param)s placeholder for each of the URL arguments in params. Links are
+    absolute if a domain is given.
+    """
+    urlresolvers = deferred('django.core.urlresolvers')
+    resolver = urlresolvers.get_resolver(urlresolvers.get_urlconf())
+    for possibility, pattern in resolver.reverse_dict.getlist(name):
+        for result, result_params in possibility:
+            if set(result_params) == set(params):
+                link = urlresolvers.get_script_prefix() + result
+                if domain is not None:
+                    link = u'http://%s%s' % (domain, link)
+                return iri_to_uri(link)
+    raise ImproperlyConfigured('There is no URL pattern called %r with the arguments %s.'
+                               % (name, ', '.join(params)))
+
+
+def link_pattern_value(value):
+    """
+    Returns value encoded for a link the way reverse() encodes URL
+    arguments.
+    """
+    if isinstance(value, (int, long)):
+        return value
+    return iri_to_uri(force_unicode(value))
+
+
 class FeedDoesNotExist(ObjectDoesNotExist):
     pass
 
 
+class FeedState(object):
+    """
+    The state of one request to a feed: the request, the feed object and
+    the current site, which get_feed() fills in.
+
+    Feed instances are shared by all the threads serving requests, so
+    anything worked out for one request should be kept here rather than on
+    the instance. Resolvers that take two arguments besides self are called
+    with the object (or item) and the FeedState, and get_object() is given
+    it as the state keyword argument if it has a parameter of that name.
+    """
+    def __init__(self, request, obj=None):
+        self.request = request
+        self.obj = obj
+        self.site = None
+
+
+def accepts_state(func):
+    """
+    Returns True if func has a parameter named state.
+    """
+    code = getattr(func, 'func_code', None)
+    return code is not None and 'state' in code.co_varnames[:code.co_argcount]
+
+
 class Feed(object):
     feed_type = feedgenerator.DefaultFeed
     title_template = None
     description_template = None
+    # Set to True if the feed's resolvers return unicode and absolute links
+    # are already URI-encoded, so the feed generator can skip normalising
+    # values a second time.
+    trusted_input = False
+    # Limits on the number of items and the approximate size in bytes of the
+    # generated feed. SYNDICATION_MAX_ITEMS and SYNDICATION_MAX_BYTES set
+    # global limits; the smaller limit applies.
+    max_items = None
+    max_bytes = None
+    # Feeds with the same item_cache_namespace resolve items the same way and
+    # share resolved items through syndication.records.item_cache.
+    item_cache_namespace = None
+    # The lite variant of a feed (see lite_variant()) leaves out the
+    # add_item() arguments in lite_omit, without resolving them, and
+    # truncates descriptions to lite_description_words words.
+    lite = False
+    lite_omit = ('author_name', 'author_email', 'author_link', 'categories',
+                 'comments', 'enclosure', 'item_copyright')
+    lite_description_words = 50
+    # Item descriptions of at least this many characters are written as
+    # CDATA sections; see SyndicationFeed.cdata_threshold.
+    cdata_threshold = None
+    # Set to True if the feed's title, link, description and other channel
+    # attributes only depend on the object and the site. The generator's
+    # arguments and header are then cached in syndication.records.header_cache
+    # until the object is saved or deleted.
+    cache_header = False
+    # A (URL name, {URL argument: item attribute name}) tuple. If set, item
+    # links are built from the named URL pattern with one string formatting
+    # operation, instead of by item_link().
+    item_link_pattern = None
+    # A syndication.enclosures.EnclosureResolver used for items that have an
+    # item_enclosure_path rather than an item_enclosure_url.
+    enclosure_resolver = None
+    # A store of generated feeds (see syndication.cache) and the number of
+    # seconds a stored feed is served before it is regenerated.
+    feed_cache = None
+    cache_timeout = 0
+    # A lock backend (see syndication.locks). If set, identical requests for
+    # the feed are regenerated by one request at a time; the others wait for
+    # it, or get the previous body if it expired less than
+    # stale_while_revalidate seconds ago.
+    regeneration_lock = None
+    stale_while_revalidate = 0
+    # Set to True to derive the ttl, and the Cache-Control and Expires
+    # headers, from how often items are published: the median interval
+    # between the pubdates of the items, between min_ttl and max_ttl minutes.
+    # Stored feeds are then kept for the ttl rather than cache_timeout.
+    adaptive_ttl = False
+    min_ttl = 5
+    max_ttl = 24 * 60
+    # The name of a header, such as 'Surrogate-Key' or 'xkey', in which to
+    # list the surrogate keys of the feed, its object and its items, so that
+    # caching proxies can be purged with syndication.purge.
+    surrogate_key_header = None
 
     def __call__(self, request, *args, **kwargs):
+        labels = metrics.feed_labels(self)
+        metrics.registry.inc('syndication_requests_total', labels)
+        # Lets syndication.metrics.MetricsMiddleware count 304s.
+        request.syndication_labels = labels
+        return self.respond(request, *args, **kwargs)
+
+    def respond(self, request, *args, **kwargs):
+        """
+        Returns the response for a request, from feed_cache if possible.
+        """
+        if self.feed_cache is None and self.regeneration_lock is None:
+            return self.render(request, *args, **kwargs)
+        store = self.feed_cache
+        if store is None:
+            store = cache.default_store
+        started = time.time()
+        key = self.get_cache_key(request, *args, **kwargs)
+        entry = store.get(key)
+        if entry is not None and entry.is_fresh():
+            response = self.stored_response(entry)
+            if response is not None:
+                metrics.registry.inc('syndication_cache_hits_total', metrics.feed_labels(self))
+                return response
+
+        lock = self.regeneration_lock
+        if lock is None:
+            return self.cached_response(self.regenerate(store, key, request, *args, **kwargs))
+        if not lock.acquire(key, blocking=False):
+            # Another request is regenerating this feed.
+            if entry is not None and entry.is_usable_stale(self.stale_while_revalidate):
+                response = self.stored_response(entry)
+                if response is not None:
+                    metrics.registry.inc('syndication_cache_stale_total', metrics.feed_labels(self))
+                    return response
+            lock.acquire(key)
+        try:
+            # Use the feed generated by the request we waited for, if any.
+            entry = store.get(key)
+            if entry is not None and (entry.is_fresh() or entry.created >= started):
+                response = self.stored_response(entry)
+                if response is not None:
+                    metrics.registry.inc('syndication_cache_hits_total', metrics.feed_labels(self))
+                    return response
+            return self.cached_response(self.regenerate(store, key, request, *args, **kwargs))
+        finally:
+            lock.release(key)
+
+    def render(self, request, *args, **kwargs):
+        """
+        Returns an HttpResponse with the generated feed.
+        """
+        started = time.time()
+        feedgen = self.generate(request, *args, **kwargs)
+        response = HttpResponse(mimetype=feedgen.mime_type)
+        feedgen.write(response, 'utf-8')
+        if self.adaptive_ttl and feedgen.feed.get('ttl') is not None:
+            self.add_cache_headers(response, int(feedgen.feed['ttl']) * 60)
+        for name, value in self.get_response_headers(feedgen):
+            response[name] = value
+        metrics.registry.observe('syndication_generation_seconds',
+                                 metrics.feed_labels(self), time.time() - started)
+        return response
+
+    def generate(self, request, *args, **kwargs):
+        """
+        Returns the populated feed generator for a request to this feed with
+        the given arguments from the URL.
+        """
+        state = FeedState(request)
+        if accepts_state(self.get_object):
+            kwargs['state'] = state
         try:
             obj = self.get_object(request, *args, **kwargs)
         except ObjectDoesNotExist:
             raise Http404('Feed object does not exist.')
-        feedgen = self.get_feed(obj, request)
-        response = HttpResponse(mimetype=feedgen.mime_type)
-        feedgen.write(response, 'utf-8')
+        return self.get_feed(obj, request, state=state)
+
+    def regenerate(self, store, key, request, *args, **kwargs):
+        """
+        Renders the feed and saves it in store. Returns the CachedFeed.
+        """
+        metrics.registry.inc('syndication_cache_misses_total', metrics.feed_labels(self))
+        response = self.render(request, *args, **kwargs)
+        now = time.time()
+        get_max_age = deferred('django.utils.cache').get_max_age
+        timeout = self.cache_timeout
+        if self.adaptive_ttl and get_max_age(response) is not None:
+            timeout = get_max_age(response)
+        headers = []
+        header = self.surrogate_key_header
+        if header is not None and response.has_header(header):
+            headers.append((header, response[header]))
+        entry = cache.CachedFeed(response.content, response['Content-Type'],
+                                 created=now, expires=now + timeout, headers=headers)
+        store.set(key, entry)
+        return entry
+
+    def get_response_headers(self, feedgen):
+        """
+        Returns the (name, value) tuples of the headers to send with the
+        output of the feed generator feedgen, apart from the content type
+        and cache headers.
+        """
+        keys = getattr(feedgen, 'surrogate_keys', None)
+        if self.surrogate_key_header is None or not keys:
+            return []
+        return [(self.surrogate_key_header, ' '.join(keys))]
+
+    def get_surrogate_keys(self, obj, items):
+        """
+        Returns the surrogate keys of the feed for obj with the given
+        items: the feed's own, then those of obj and of the items that are
+        model instances, then those of the items' models, without
+        duplicates.
+        """
+        keys = [purge.feed_surrogate_key(self)]
+        model_keys = []
+        seen = {}
+        for o in [obj] + list(items):
+            key = purge.surrogate_key(o)
+            if key is not None and key not in seen:
+                seen[key] = True
+                keys.append(key)
+        for item in items:
+            key = purge.model_surrogate_key(item)
+            if key is not None and key not in seen:
+                seen[key] = True
+                model_keys.append(key)
+        return keys + model_keys
+
+    def cached_response(self, entry):
+        """
+        Returns the response for a stored feed, with cache headers for the
+        rest of its lifetime if adaptive_ttl is set.
+        """
+        response = entry.response()
+        if self.adaptive_ttl and entry.expires is not None:
+            self.add_cache_headers(response, entry.expires - time.time())
         return response
 
+    def stored_response(self, entry):
+        """
+        Returns cached_response(entry), or None if the stored body can't be
+        read any more (e.g. a snapshot removed from disk), in which case the
+        feed is regenerated.
+        """
+        try:
+            return self.cached_response(entry)
+        except (IOError, OSError), e:
+            logger.warning('Stored feed %s.%s could not be read: %s',
+                           self.__class__.__module__, self.__class__.__name__, e)
+            return None
+
+    def add_cache_headers(self, response, max_age):
+        """
+        Sets the Cache-Control max-age and Expires headers of response to
+        max_age seconds from now.
+        """
+        max_age = max(int(round(max_age)), 0)
+        deferred('django.utils.cache').patch_cache_control(response, max_age=max_age)
+        response['Expires'] = http_date(time.time() + max_age)
+
+    def get_adaptive_ttl(self, pubdates, now=None):
+        """
+        Returns the ttl in minutes for a feed with items published at
+        pubdates: the median interval between them, within min_ttl and
+        max_ttl. Feeds without pubdates get max_ttl.
+        """
+        interval = median_interval(pubdates, now)
+        if interval is None:
+            return self.max_ttl
+        return int(min(max(interval / 60, self.min_ttl), self.max_ttl))
+
+    def set_adaptive_ttl(self, feed):
+        """
+        Sets the ttl of the feed generator feed from the pubdates of its
+        items.
+        """
+        feed.feed['ttl'] = unicode(self.get_adaptive_ttl(
+            [item['pubdate'] for item in feed.items if item['pubdate'] is not None]))
+
+    def get_cache_key(self, request, *args, **kwargs):
+        """
+        Returns a string identifying the output of this feed for the request:
+        the feed class and type, the current site, the path, the query string
+        parameters (in any order) and the arguments from the URL. Override it
+        if the feed depends on anything else about the request.
+        """
+        kwargs = kwargs.items()
+        kwargs.sort()
+        GET = getattr(request, 'GET', {})
+        if hasattr(GET, 'lists'):
+            query = GET.lists()
+        else:
+            query = GET.items()
+        query.sort()
+        return smart_str('%s.%s:%s.%s:%s:%s:%r:%r:%r' % (
+            self.__class__.__module__, self.__class__.__name__,
+            self.feed_type.__module__, self.feed_type.__name__,
+            get_current_site(request).domain, request.path, query, args, kwargs))
+
     def item_title(self, item):
         # Titles should be double escaped by default (see #6533)
         return escape(force_unicode(item))
@@ -53,7 +504,34 @@ class Feed(object):
         except AttributeError:
             raise ImproperlyConfigured('Give your %s class a get_absolute_url() method, or define an item_link() method in your Feed class.' % item.__class__.__name__)
 
-    def __get_dynamic_attr(self, attname, obj, default=None):
+    def get_link_pattern(self, domain=None):
+        """
+        Returns the format string item_link_pattern compiles to, with the
+        domain if one is given, compiling it the first time.
+        """
+        urlresolvers = deferred('django.core.urlresolvers')
+        name, fields = self.item_link_pattern
+        key = (name, tuple(fields), domain, urlresolvers.get_script_prefix(),
+               urlresolvers.get_urlconf())
+        try:
+            return compiled_link_patterns[key]
+        except KeyError:
+            link = compiled_link_patterns[key] = compile_link_pattern(name, fields, domain)
+            return link
+
+    def pattern_link(self, item, domain=None):
+        """
+        Returns the link to item built from item_link_pattern, as a URI
+        bytestring. The link is absolute if a domain is given.
+        """
+        link = self.get_link_pattern(domain)
+        fields = self.item_link_pattern[1]
+        values = {}
+        for param, attname in fields.items():
+            values[param] = link_pattern_value(getattr(item, attname))
+        return link % values
+
+    def __get_dynamic_attr(self, attname, obj, default=None, state=None):
         try:
             attr = getattr(self, attname)
         except AttributeError:
@@ -67,12 +545,30 @@ class Feed(object):
                 argcount = attr.func_code.co_argcount
             else:
                 argcount = attr.__call__.func_code.co_argcount
-            if argcount == 2: # one argument is 'self'
+            if argcount == 3: # self, obj and the FeedState
+                return attr(obj, state)
+            elif argcount == 2: # one argument is 'self'
                 return attr(obj)
             else:
                 return attr()
         return attr
 
+    def item_resolvers_take_state(self):
+        """
+        Returns True if any of the item resolvers is called with the
+        FeedState, so resolved items may differ from one feed object to
+        another.
+        """
+        for attname in ITEM_RESOLVERS:
+            attr = getattr(self, attname, None)
+            if not callable(attr):
+                continue
+            if not hasattr(attr, 'func_code'):
+                attr = attr.__call__
+            if attr.func_code.co_argcount == 3:
+                return True
+        return False
+
     def feed_extra_kwargs(self, obj):
         """
         Returns an extra keyword arguments dictionary that is used when
@@ -90,124 +586,438 @@ class Feed(object):
     def get_object(self, request, *args, **kwargs):
         return None
 
-    def get_feed(self, obj, request):
+    def warm_up(self, request=None):
         """
-        Returns a feedgenerator.DefaultFeed object, fully populated, for
-        this feed. Raises FeedDoesNotExist for invalid parameters.
+        Does the work that would otherwise slow down the first request to this
+        feed: preloads its templates, looks up the current site and compiles
+        item_link_pattern, for the current site's domain if it is known
+        without a request, or for the request's. If a request is given, the
+        feed is also rendered once for it.
         """
+        for name in (self.title_template, self.description_template):
+            if name is not None:
+                preload_template(name)
+        Site = deferred('django.contrib.sites.models').Site
+        domain = None
         if Site._meta.installed:
-            current_site = Site.objects.get_current()
+            domain = Site.objects.get_current().domain
+        elif request is not None:
+            domain = get_current_site(request).domain
+        if self.item_link_pattern is not None:
+            self.get_link_pattern()
+            if domain is not None:
+                self.get_link_pattern(domain)
+        if request is not None:
+            self(request)
+
+    def get_items(self, obj, limit=None, state=None):
+        """
+        Returns the feed's items. If limit is given, no more than that many
+        are needed, and QuerySets, lists and tuples are sliced accordingly.
+        """
+        items = self.__get_dynamic_attr('items', obj, state=state)
+        if limit is not None and isinstance(items, (deferred('django.db.models.query').QuerySet,
+                                                    list, tuple)):
+            items = items[:limit]
+        return items
+
+    def items_for_objects(self, objs, limit=None):
+        """
+        Returns a dictionary mapping each of objs to its items, for
+        generate_many(). Override this to fetch the items of all the objects
+        with one query; by default get_items() is called for each object.
+        """
+        return dict([(obj, self.get_items(obj, limit)) for obj in objs])
+
+    def get_feed_path(self, obj):
+        """
+        Returns the path of the feed for obj, for generate_many(), or None
+        to use the path of the request it is given.
+        """
+        return None
+
+    def generate_many(self, request, objs, encoding='utf-8'):
+        """
+        Returns a dictionary mapping each of objs, the objects get_object()
+        would return, to its serialized feed. The items of all the feeds are
+        fetched with items_for_objects(), and items that appear in several
+        feeds are only resolved once. Each feed is built for a copy of
+        request with its path set to get_feed_path(obj), if that isn't None.
+        """
+        objs = list(objs)
+        max_items = effective_limit(self.max_items,
+                getattr(settings, 'SYNDICATION_MAX_ITEMS', None))
+        limit = None
+        if max_items is not None:
+            limit = max_items + 1
+        items = self.items_for_objects(objs, limit)
+        resolved = {}
+        feeds = {}
+        for obj in objs:
+            obj_request = request
+            path = self.get_feed_path(obj)
+            if path is not None:
+                obj_request = copy.copy(request)
+                obj_request.path = path
+            feeds[obj] = self.get_feed(obj, obj_request, items[obj], resolved,
+                                       FeedState(obj_request, obj)).writeString(encoding)
+        return feeds
+
+    def get_item_pubdate(self, item, state=None):
+        """
+        Returns the item's pubdate, in the local time zone if the item_pubdate
+        hook returns a naive datetime.
+        """
+        pubdate = self.__get_dynamic_attr('item_pubdate', item, state=state)
+        if pubdate and not pubdate.tzinfo:
+            ltz = tzinfo.LocalTimezone(pubdate)
+            pubdate = pubdate.replace(tzinfo=ltz)
+        return pubdate
+
+    def get_item_guid(self, item, state=None):
+        """
+        Returns the item's guid, or its link (without the domain added) if it
+        has no guid.
+        """
+        guid = self.__get_dynamic_attr('item_guid', item, state=state)
+        if guid is None:
+            if self.item_link_pattern is not None:
+                return self.pattern_link(item)
+            guid = self.__get_dynamic_attr('item_link', item, state=state)
+        return guid
+
+    def resolve_item(self, item, request, current_site, templates, omit=(), state=None):
+        """
+        Returns a dictionary of the keyword arguments for the feed generator's
+        add_item() for item, apart from item_extra_kwargs(). templates is a
+        (title template, description template) tuple; either may be None.
+        Arguments named in omit are set to None without being resolved.
+        state is the FeedState passed to resolvers that accept it.
+
+        If item_cache_namespace is set, the result is shared through the item
+        cache with other feeds in the same namespace.
+        """
+        namespace = self.item_cache_namespace
+        if namespace is not None:
+            if omit:
+                namespace = (namespace, tuple(sorted(omit)))
+            record = records.item_cache.get(namespace, current_site.domain, item)
+            if record is not None:
+                return dict(record)
+
+        title_tmp, description_tmp = templates
+        if title_tmp is not None or description_tmp is not None:
+            RequestContext = deferred('django.template').RequestContext
+        if title_tmp is not None:
+            title = title_tmp.render(RequestContext(request, {'obj': item, 'site': current_site}))
+        else:
+            title = self.__get_dynamic_attr('item_title', item, state=state)
+        if 'description' in omit:
+            description = None
+        elif description_tmp is not None:
+            description = description_tmp.render(RequestContext(request, {'obj': item, 'site': current_site}))
         else:
-            current_site = RequestSite(request)
+            description = self.__get_dynamic_attr('item_description', item, state=state)
+        if self.item_link_pattern is not None:
+            link = self.pattern_link(item, current_site.domain)
+        else:
+            link = add_domain(current_site.domain,
+                              self.__get_dynamic_attr('item_link', item, state=state))
+        enc = None
+        if 'enclosure' not in omit:
+            enc_url = self.__get_dynamic_attr('item_enclosure_url', item, state=state)
+            if enc_url:
+                enc = feedgenerator.Enclosure(
+                    url = smart_unicode(enc_url),
+                    length = smart_unicode(self.__get_dynamic_attr('item_enclosure_length', item, state=state)),
+                    mime_type = smart_unicode(self.__get_dynamic_attr('item_enclosure_mime_type', item, state=state))
+                )
+            elif self.enclosure_resolver is not None:
+                enc_path = self.__get_dynamic_attr('item_enclosure_path', item, state=state)
+                if enc_path:
+                    enc = self.enclosure_resolver.enclosure(enc_path)
+        author_name = author_email = author_link = None
+        if 'author_name' not in omit:
+            author_name = self.__get_dynamic_attr('item_author_name', item, state=state)
+        if author_name is not None:
+            if 'author_email' not in omit:
+                author_email = self.__get_dynamic_attr('item_author_email', item, state=state)
+            if 'author_link' not in omit:
+                author_link = self.__get_dynamic_attr('item_author_link', item, state=state)
+
+        kwargs = {
+            'title': title,
+            'link': link,
+            'description': description,
+            'enclosure': enc,
+            'author_name': author_name,
+            'author_email': author_email,
+            'author_link': author_link,
+        }
+        if 'unique_id' not in omit:
+            kwargs['unique_id'] = self.__get_dynamic_attr('item_guid', item, link, state)
+        if 'pubdate' not in omit:
+            kwargs['pubdate'] = self.get_item_pubdate(item, state)
+        if 'categories' not in omit:
+            kwargs['categories'] = self.__get_dynamic_attr('item_categories', item, state=state)
+        if 'item_copyright' not in omit:
+            kwargs['item_copyright'] = self.__get_dynamic_attr('item_copyright', item, state=state)
+        if namespace is not None:
+            if kwargs.get('categories') is not None:
+                kwargs['categories'] = tuple(kwargs['categories'])
+            records.item_cache.set(namespace, current_site.domain, item, kwargs)
+            kwargs = dict(kwargs)
+        return kwargs
+
+    def omitted_item_fields(self):
+        """
+        Returns the add_item() arguments get_feed() doesn't resolve: those
+        in lite_omit for the lite variant, and those the feed type doesn't
+        write. Items shared through item_cache_namespace are resolved for
+        any feed type.
+        """
+        omit = {}
+        if self.lite:
+            for name in self.lite_omit:
+                omit[name] = True
+        fields = declared_fields(self.feed_type, 'item_fields', ITEM_WRITERS)
+        if fields is not None and self.item_cache_namespace is None:
+            for name in OPTIONAL_ITEM_FIELDS:
+                if name not in fields:
+                    omit[name] = True
+        omit = omit.keys()
+        omit.sort()
+        return tuple(omit)
+
+    def lite_item(self, kwargs):
+        """
+        Trims the add_item() keyword arguments of an item for the lite
+        variant of the feed: clears the arguments in lite_omit and truncates
+        the description to lite_description_words words.
+        """
+        for name in self.lite_omit:
+            if name in kwargs:
+                kwargs[name] = None
+        if kwargs.get('description') and self.lite_description_words is not None:
+            kwargs['description'] = truncate_html_words(kwargs['description'],
+                                                        self.lite_description_words)
+        return kwargs
+
+    @classmethod
+    def lite_variant(cls, *args, **kwargs):
+        """
+        Returns an instance of the feed that serves its lite variant.
+        """
+        feed = cls(*args, **kwargs)
+        feed.lite = True
+        return feed
 
-        link = self.__get_dynamic_attr('link', obj)
+    def get_feed_kwargs(self, obj, request, current_site, state=None):
+        """
+        Returns the keyword arguments for the feed generator.
+        """
+        link = self.__get_dynamic_attr('link', obj, state=state)
         link = add_domain(current_site.domain, link)
 
-        feed = self.feed_type(
-            title = self.__get_dynamic_attr('title', obj),
-            subtitle = self.__get_dynamic_attr('subtitle', obj),
+        feed_kwargs = self.feed_extra_kwargs(obj)
+        if self.trusted_input:
+            # add_domain() has already run iri_to_uri() on relative links.
+            feed_kwargs['trusted'] = True
+
+        feed_kwargs.update(
+            title = self.__get_dynamic_attr('title', obj, state=state),
             link = link,
-            description = self.__get_dynamic_attr('description', obj),
+            description = self.__get_dynamic_attr('description', obj, state=state),
             language = settings.LANGUAGE_CODE.decode(),
             feed_url = add_domain(current_site.domain,
-                    self.__get_dynamic_attr('feed_url', obj) or request.path),
-            author_name = self.__get_dynamic_attr('author_name', obj),
-            author_link = self.__get_dynamic_attr('author_link', obj),
-            author_email = self.__get_dynamic_attr('author_email', obj),
-            categories = self.__get_dynamic_attr('categories', obj),
-            feed_copyright = self.__get_dynamic_attr('feed_copyright', obj),
-            feed_guid = self.__get_dynamic_attr('feed_guid', obj),
-            ttl = self.__get_dynamic_attr('ttl', obj),
-            **self.feed_extra_kwargs(obj)
+                    self.__get_dynamic_attr('feed_url', obj, state=state) or request.path),
         )
+        # Only resolve the optional attributes the feed type writes.
+        fields = declared_fields(self.feed_type, 'feed_fields', FEED_WRITERS)
+        for name in OPTIONAL_FEED_FIELDS:
+            if fields is None or name in fields:
+                feed_kwargs[name] = self.__get_dynamic_attr(name, obj, state=state)
+        return feed_kwargs
 
-        title_tmp = None
-        if self.title_template is not None:
-            try:
-                title_tmp = loader.get_template(self.title_template)
-            except TemplateDoesNotExist:
-                pass
-
-        description_tmp = None
-        if self.description_template is not None:
-            try:
-                description_tmp = loader.get_template(self.description_template)
-            except TemplateDoesNotExist:
-                pass
-
-        for item in self.__get_dynamic_attr('items', obj):
-            if title_tmp is not None:
-                title = title_tmp.render(RequestContext(request, {'obj': item, 'site': current_site}))
-            else:
-                title = self.__get_dynamic_attr('item_title', item)
-            if description_tmp is not None:
-                description = description_tmp.render(RequestContext(request, {'obj': item, 'site': current_site}))
+    def get_feed(self, obj, request, items=None, resolved=None, state=None):
+        """
+        Returns a feedgenerator.DefaultFeed object, fully populated, for
+        this feed. Raises FeedDoesNotExist for invalid parameters.
+
+        items, if given, are used instead of calling get_items(). resolved
+        is an optional dictionary in which resolved items are kept, so that
+        items shared by several feeds built with the same dictionary are only
+        resolved once; it is ignored if item resolvers take the FeedState,
+        since they may depend on obj. state is the FeedState of the request; a new one is
+        made if it isn't given.
+        """
+        current_site = get_current_site(request)
+        if state is None:
+            state = FeedState(request)
+        state.obj = obj
+        state.site = current_site
+        # Overrides of these methods written before FeedState existed don't
+        # take it.
+        kwargs_for = lambda method: accepts_state(method) and {'state': state} or {}
+        items_kwargs = kwargs_for(self.get_items)
+        resolve_kwargs = kwargs_for(self.resolve_item)
+        if resolved is not None and self.item_resolvers_take_state():
+            resolved = None
+
+        record = None
+        if self.cache_header:
+            namespace = ('header', self.__class__, self.feed_type, request.path)
+            record = records.header_cache.get(namespace, current_site.domain, obj)
+        if record is not None:
+            feed_kwargs, header = record
+            feed = self.feed_type(**feed_kwargs)
+            feed.header = header
+        else:
+            feed_kwargs = self.get_feed_kwargs(obj, request, current_site,
+                                               **kwargs_for(self.get_feed_kwargs))
+            feed = self.feed_type(**feed_kwargs)
+            if self.cache_header:
+                capture_header = getattr(feed, 'capture_header', None)
+                if capture_header is not None:
+                    feed.header = capture_header()
+                records.header_cache.set(namespace, current_site.domain, obj,
+                                         (feed_kwargs, feed.header))
+
+        templates = (find_template(self.title_template),
+                     find_template(self.description_template))
+        omit = self.omitted_item_fields()
+
+        feed.cdata_threshold = self.cdata_threshold
+        feed.max_bytes = effective_limit(self.max_bytes,
+                getattr(settings, 'SYNDICATION_MAX_BYTES', None))
+        max_items = effective_limit(self.max_items,
+                getattr(settings, 'SYNDICATION_MAX_ITEMS', None))
+        if items is None:
+            if max_items is not None:
+                # Fetch one extra item so we can tell if anything was left out.
+                items = self.get_items(obj, max_items + 1, **items_kwargs)
             else:
-                description = self.__get_dynamic_attr('item_description', item)
-            link = add_domain(current_site.domain, self.__get_dynamic_attr('item_link', item))
-            enc = None
-            enc_url = self.__get_dynamic_attr('item_enclosure_url', item)
-            if enc_url:
-                enc = feedgenerator.Enclosure(
-                    url = smart_unicode(enc_url),
-                    length = smart_unicode(self.__get_dynamic_attr('item_enclosure_length', item)),
-                    mime_type = smart_unicode(self.__get_dynamic_attr('item_enclosure_mime_type', item))
-                )
-            author_name = self.__get_dynamic_attr('item_author_name', item)
-            if author_name is not None:
-                author_email = self.__get_dynamic_attr('item_author_email', item)
-                author_link = self.__get_dynamic_attr('item_author_link', item)
+                items = self.get_items(obj, **items_kwargs)
+
+        added = []
+        for i, item in enumerate(items):
+            if max_items is not None and i >= max_items:
+                feed.truncated = True
+                logger.warning('Feed %s.%s truncated to %d items for %s.',
+                               self.__class__.__module__, self.__class__.__name__,
+                               max_items, request.path)
+                break
+            if resolved is None:
+                kwargs = self.resolve_item(item, request, current_site, templates, omit,
+                                           **resolve_kwargs)
             else:
-                author_email = author_link = None
-
-            pubdate = self.__get_dynamic_attr('item_pubdate', item)
-            if pubdate and not pubdate.tzinfo:
-                ltz = tzinfo.LocalTimezone(pubdate)
-                pubdate = pubdate.replace(tzinfo=ltz)
-
-            feed.add_item(
-                title = title,
-                link = link,
-                description = description,
-                unique_id = self.__get_dynamic_attr('item_guid', item, link),
-                enclosure = enc,
-                pubdate = pubdate,
-                author_name = author_name,
-                author_email = author_email,
-                author_link = author_link,
-                categories = self.__get_dynamic_attr('item_categories', item),
-                item_copyright = self.__get_dynamic_attr('item_copyright', item),
-                **self.item_extra_kwargs(item)
-            )
+                key = records.object_key(item) or id(item)
+                try:
+                    kwargs = dict(resolved[key])
+                except KeyError:
+                    kwargs = self.resolve_item(item, request, current_site, templates, omit,
+                                               **resolve_kwargs)
+                    resolved[key] = dict(kwargs)
+            kwargs.update(self.item_extra_kwargs(item))
+            if self.lite:
+                kwargs = self.lite_item(kwargs)
+            feed.add_item(**kwargs)
+            if self.surrogate_key_header is not None:
+                added.append(item)
+        if self.surrogate_key_header is not None:
+            feed.surrogate_keys = self.get_surrogate_keys(obj, added)
+        if self.adaptive_ttl:
+            self.set_adaptive_ttl(feed)
+        metrics.registry.inc('syndication_items_total', metrics.feed_labels(self), feed.num_items())
         return feed
 
 
-def feed(request, url, feed_dict=None):
-    """Provided for backwards compatibility."""
+class FeedRoutes(object):
+    """
+    A feed_dict compiled for the deprecated feed() view.
+
+    The slugs are checked once, and feed classes that support it are
+    instantiated once per thread and slug and then reused, pointed at each
+    new request with bind().
+    """
+    def __init__(self, feed_dict):
+        for slug in feed_dict:
+            if '/' in slug:
+                raise ImproperlyConfigured("Feed slug %r can't contain a slash." % slug)
+        self.feed_dict = dict(feed_dict)
+        self.reusable = {}
+        for slug, feed_class in self.feed_dict.items():
+            self.reusable[slug] = getattr(feed_class, 'reusable', lambda: False)()
+        self.local = threading.local()
+
+    def route(self, url):
+        """
+        Returns (slug, param, feed class) for url. Raises KeyError if the
+        slug isn't registered.
+        """
+        try:
+            slug, param = url.split('/', 1)
+        except ValueError:
+            slug, param = url, ''
+        return slug, param, self.feed_dict[slug]
+
+    def get_instance(self, slug, feed_class, request):
+        if not self.reusable[slug]:
+            return feed_class(slug, request)
+        instances = self.local.__dict__.setdefault('instances', {})
+        try:
+            f = instances[slug]
+        except KeyError:
+            f = instances[slug] = feed_class(slug, request)
+        else:
+            f.bind(request)
+        return f
+
+# Maps id(feed_dict) to (feed_dict, FeedRoutes) for feed_dicts seen by feed().
+compiled_feed_dicts = {}
+
+
+def get_feed_routes(feed_dict):
+    """
+    Returns the FeedRoutes for feed_dict, compiling it on first use.
+    Changes to a feed_dict after its first request aren't picked up.
+    """
+    try:
+        compiled_dict, routes = compiled_feed_dicts[id(feed_dict)]
+        if compiled_dict is feed_dict:
+            return routes
+    except KeyError:
+        pass
     import warnings
     warnings.warn('The syndication feed() view is deprecated. Please use the '
                   'new class based view API.',
                   category=PendingDeprecationWarning)
+    routes = FeedRoutes(feed_dict)
+    compiled_feed_dicts[id(feed_dict)] = (feed_dict, routes)
+    return routes
+
 
+def feed(request, url, feed_dict=None):
+    """Provided for backwards compatibility."""
     if not feed_dict:
         raise Http404("No feeds are registered.")
 
+    routes = get_feed_routes(feed_dict)
     try:
-        slug, param = url.split('/', 1)
-    except ValueError:
-        slug, param = url, ''
-
-    try:
-        f = feed_dict[slug]
+        slug, param, f = routes.route(url)
     except KeyError:
-        raise Http404("Slug %r isn't registered." % slug)
+        raise Http404("Slug %r isn't registered." % url.split('/', 1)[0])
 
+    instance = routes.get_instance(slug, f, request)
     try:
-        feedgen = f(slug, request).get_feed(param)
-    except FeedDoesNotExist:
-        raise Http404("Invalid feed parameters. Slug %r is valid, but other parameters, or lack thereof, are not." % slug)
+        try:
+            feedgen = instance.get_feed(param)
+        except FeedDoesNotExist:
+            raise Http404("Invalid feed parameters. Slug %r is valid, but other parameters, or lack thereof, are not." % slug)
+    finally:
+        # Don't keep the request alive until the next one.
+        instance.request = None
 
     response = HttpResponse(mimetype=feedgen.mime_type)
     feedgen.write(response, 'utf-8')
     return response
-
@@ -0,0 +1,114 @@
+"""
+Warms up the feeds in a URLconf so the first request to each one after a
+deploy doesn't pay for template loading, the site lookup and lazy imports.
+
+Call warm_up() from your WSGI script before the server starts taking
+traffic (in a preforking server, before it forks), or run the
+``warmup_feeds`` management command to see how long each feed takes.
+"""
+import logging
+import re
+import time
+
+from django.core.urlresolvers import get_resolver, RegexURLPattern, RegexURLResolver
+from django.http import HttpRequest
+
+from syndication import views
+
+logger = logging.getLogger('syndication')
+
+literal_path_re = re.compile(r'^[\w/.~-]*$')
+
+
+def literal_path(regexes):
+    """
+    Returns the path matched by a list of nested URL pattern regexes, or None
+    if they match anything other than a single literal path.
+    """
+    path = ''
+    for regex in regexes:
+        if regex.startswith('^'):
+            regex = regex[1:]
+        if regex.endswith('$'):
+            regex = regex[:-1]
+        if not literal_path_re.match(regex):
+            return None
+        path += regex
+    return '/' + path
+
+
+def find_feeds(urlconf=None):
+    """
+    Walks the URLconf and returns a list of (name, path, target) tuples.
+    target is either a syndication.views.Feed instance or, for slugs
+    registered in a feed_dict passed to the deprecated feed() view, a
+    (slug, feed class, feed_dict) tuple. path is the literal path of the URL pattern, or
+    None if it takes arguments.
+    """
+    found = []
+
+    def walk(patterns, regexes):
+        for pattern in patterns:
+            pattern_regexes = regexes + [pattern.regex.pattern]
+            if isinstance(pattern, RegexURLResolver):
+                walk(pattern.url_patterns, pattern_regexes)
+                continue
+            if not isinstance(pattern, RegexURLPattern):
+                continue
+            callback = pattern.callback
+            if isinstance(callback, views.Feed):
+                name = '%s.%s (%s)' % (callback.__class__.__module__,
+                    callback.__class__.__name__, ''.join(pattern_regexes))
+                found.append((name, literal_path(pattern_regexes), callback))
+            elif callback is views.feed:
+                feed_dict = pattern.default_args.get('feed_dict') or {}
+                slugs = feed_dict.keys()
+                slugs.sort()
+                for slug in slugs:
+                    feed_class = feed_dict[slug]
+                    name = '%s.%s (%s, slug %r)' % (feed_class.__module__,
+                        feed_class.__name__, ''.join(pattern_regexes), slug)
+                    found.append((name, None, (slug, feed_class, feed_dict)))
+
+    walk(get_resolver(urlconf).url_patterns, [])
+    return found
+
+
+def warm_up_request(path, host='localhost'):
+    """
+    Returns a minimal request for rendering a feed outside of a real request.
+    """
+    request = HttpRequest()
+    request.path = path
+    request.META = {'SERVER_NAME': host, 'SERVER_PORT': '80'}
+    return request
+
+
+def warm_up(urlconf=None, render=False):
+    """
+    Warms up every feed in the URLconf. If render is True, feeds whose URL
+    pattern takes no arguments are also rendered once.
+
+    Returns a list of (name, seconds, error) tuples, one per feed, where error
+    is None if the feed was warmed up successfully.
+    """
+    results = []
+    for name, path, target in find_feeds(urlconf):
+        start = time.time()
+        error = None
+        try:
+            if isinstance(target, views.Feed):
+                request = None
+                if render and path is not None:
+                    request = warm_up_request(path)
+                target.warm_up(request)
+            else:
+                slug, feed_class, feed_dict = target
+                views.get_feed_routes(feed_dict)
+                for template_name in feed_class.template_names(slug):
+                    views.preload_template(template_name)
+        except Exception, e:
+            logger.exception('Error warming up feed %s.', name)
+            error = e
+        results.append((name, time.time() - start, error))
+    return results